@@ -11,6 +11,7 @@ class NestedUnnecessaryField(NestedModelField):
 class NestedTagField(NestedModelField):
     class Meta(object):
         model = Tag
+        compiled_read = True
 
 
 class NestedFeatureTypeField(NestedModelField):
@@ -21,6 +22,7 @@ class NestedFeatureTypeField(NestedModelField):
 class NestedAuthorField(NestedModelField):
     class Meta(object):
         model = Author
+        compiled_read = True
 
 
 class NestedQuizAnswerField(NestedModelField):
@@ -1,9 +1,29 @@
+import json
+import sys
+import warnings
+from unittest import skipUnless
+
 from django.core.urlresolvers import reverse
-from django.test import TestCase
+from django.db import connection
+from django.db.models import Prefetch
+from django.db.models.signals import m2m_changed, post_init
+from django.test.utils import CaptureQueriesContext
+from django.test import TestCase, TransactionTestCase, override_settings
 from model_mommy import mommy
-from rest_framework.test import APIClient
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient, APIRequestFactory
 
+from example import benchmarks
 from .models import *  # noqa
+from nested_serializers import NestedModelField, NestedModelSerializer, instrumentation
+from nested_serializers.serializers import (
+    IDENTITY_MAP_CONTEXT_KEY, FK, M2M, ORPHANS_DELETE, ORPHANS_NULL, REVERSE_FK, SCALAR, clear_nested_serializer_classes
+)
+from .fields import (
+    NestedAuthorField, NestedFeatureTypeField, NestedQuizAnswerField, NestedTagField, NestedUnnecessaryField
+)
+from .serializers import ArticleSerializer
+from .views import ArticleExportViewSet, ArticleViewSet
 
 
 class ArticleTests(TestCase):
@@ -49,6 +69,25 @@ class ArticleTests(TestCase):
         response = self.client.post(url, data=payload, format='json')
         self.assertIn(response.status_code, (200, 201, 202))
 
+    def test_create_with_nested_list(self):
+        url = reverse('api:article-list')
+
+        ft = FeatureType.objects.create(name='article')
+        tags = mommy.make(Tag, _quantity=2)
+
+        payload = {
+            'title': 'some dumb article',
+            'feature_type': {
+                'id': ft.pk,
+            },
+            'tags': [{'id': tag.pk} for tag in tags],
+            'unnecessary': None,
+            'authors': [],
+        }
+        response = self.client.post(url, data=payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([tag['id'] for tag in response.data['tags']], [tag.pk for tag in tags])
+
     def test_create_nested_model_raises_error(self):
         url = reverse('api:article-list')
         payload = {
@@ -190,6 +229,716 @@ class ArticleTests(TestCase):
         tags = Tag.objects.all().count()
         self.assertEqual(tags, count_tags)
 
+    def test_nested_list_references_resolved_in_one_query(self):
+        ft = mommy.make(FeatureType)
+        article = mommy.make(Article, feature_type=ft)
+        tags = mommy.make(Tag, _quantity=5)
+
+        payload = {
+            'title': article.title,
+            'feature_type': {'id': ft.pk},
+            'tags': [{'id': tag.pk} for tag in reversed(tags)],
+            'unnecessary': None,
+            'authors': [],
+        }
+        serializer = ArticleSerializer(article, data=payload)
+        # one for the feature type, one for all of the tags
+        with self.assertNumQueries(2):
+            self.assertTrue(serializer.is_valid())
+        self.assertEqual(serializer.validated_data['tags'], list(reversed(tags)))
+
+    def test_nested_list_missing_reference(self):
+        ft = mommy.make(FeatureType)
+        tag = mommy.make(Tag)
+
+        payload = {
+            'title': 'some article',
+            'feature_type': {'id': ft.pk},
+            'tags': [{'id': tag.pk}, {'id': tag.pk + 100}],
+            'unnecessary': None,
+            'authors': [],
+        }
+        serializer = ArticleSerializer(data=payload)
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(serializer.errors['tags'][0], {})
+        self.assertTrue(serializer.errors['tags'][1])
+
+    def test_identity_map_shared_across_tree(self):
+        ft = mommy.make(FeatureType)
+        tag = mommy.make(Tag)
+
+        payload = {
+            'title': 'some article',
+            'feature_type': {'id': ft.pk},
+            'tags': [{'id': tag.pk}, {'id': tag.pk}],
+            'unnecessary': None,
+            'authors': [],
+        }
+        serializer = ArticleSerializer(data=payload)
+        self.assertTrue(serializer.is_valid())
+        identity_map = serializer.context[IDENTITY_MAP_CONTEXT_KEY]
+        self.assertIs(identity_map[(Tag, tag.pk)], serializer.validated_data['tags'][0])
+        self.assertIs(identity_map[(Tag, tag.pk)], serializer.validated_data['tags'][1])
+
+        # everything the tree has already seen comes for free
+        tags_field = serializer.fields['tags']
+        with self.assertNumQueries(0):
+            self.assertIs(tags_field.child.get_instance(str(tag.pk)), identity_map[(Tag, tag.pk)])
+            self.assertIs(serializer.fields['feature_type'].get_instance(ft.pk), identity_map[(FeatureType, ft.pk)])
+
+    def test_list_query_count_is_constant(self):
+        url = reverse('api:article-list')
+        for _ in range(5):
+            article = mommy.make(Article, feature_type=mommy.make(FeatureType), unnecessary=mommy.make(UnnecessaryModel))
+            article.tags.add(*mommy.make(Tag, _quantity=2))
+            mommy.make(Author, article=article, _quantity=2)
+
+        # articles (joined to their feature types and unnecessaries), tags and authors
+        with self.assertNumQueries(3):
+            response = self.client.get(url, format='json')
+        self.assertEqual(len(response.data), 5)
+        self.assertEqual(len(response.data[0]['tags']), 2)
+        self.assertEqual(len(response.data[0]['authors']), 2)
+        self.assertIsNotNone(response.data[0]['unnecessary'])
+
+    def test_update_nested_list_only_writes_changes(self):
+        ft = mommy.make(FeatureType)
+        article = mommy.make(Article, feature_type=ft)
+        tags = mommy.make(Tag, _quantity=3)
+        article.tags.add(*tags)
+
+        changes = []
+
+        def record_change(sender, action, pk_set, **kwargs):
+            if action in ('post_add', 'post_remove', 'post_clear'):
+                changes.append((action, pk_set))
+
+        m2m_changed.connect(record_change, sender=Article.tags.through)
+        self.addCleanup(m2m_changed.disconnect, record_change, sender=Article.tags.through)
+
+        url = reverse('api:article-detail', kwargs={'pk': article.pk})
+        payload = self.client.get(url, format='json').data
+
+        # nothing changed, so nothing gets written
+        update_response = self.client.put(url, data=payload, format='json')
+        self.assertEqual(update_response.status_code, 200)
+        self.assertEqual(changes, [])
+
+        new_tag = mommy.make(Tag)
+        payload['tags'] = [{'id': tags[0].pk}, {'id': tags[1].pk}, {'id': new_tag.pk}]
+        update_response = self.client.put(url, data=payload, format='json')
+        self.assertEqual(update_response.status_code, 200)
+        self.assertEqual(changes, [('post_remove', set([tags[2].pk])), ('post_add', set([new_tag.pk]))])
+        self.assertEqual(set(article.tags.values_list('pk', flat=True)), set([tags[0].pk, tags[1].pk, new_tag.pk]))
+
+    def test_nested_save_is_one_unit_of_work(self):
+        ft = mommy.make(FeatureType)
+        article = mommy.make(Article, feature_type=ft, title='old title')
+        tags = mommy.make(Tag, _quantity=3)
+        article.tags.add(*tags[:2])
+
+        url = reverse('api:article-detail', kwargs={'pk': article.pk})
+        payload = self.client.get(url, format='json').data
+        payload['title'] = 'new title'
+        payload['tags'] = [{'id': tags[1].pk}, {'id': tags[2].pk}]
+
+        def fail(sender, action, **kwargs):
+            if action == 'pre_add':
+                raise RuntimeError('no more tags')
+
+        m2m_changed.connect(fail, sender=Article.tags.through)
+        try:
+            with self.assertRaises(RuntimeError):
+                self.client.put(url, data=payload, format='json')
+        finally:
+            m2m_changed.disconnect(fail, sender=Article.tags.through)
+
+        # the failed tag write takes the title (and the tag removal) down with it
+        self.assertEqual(Article.objects.get(pk=article.pk).title, 'old title')
+        self.assertEqual(set(article.tags.all()), set(tags[:2]))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.put(url, data=payload, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(article.tags.all()), set(tags[1:]))
+
+        sql = [query['sql'] for query in queries]
+        self.assertEqual(len([s for s in sql if 'DELETE FROM "app_article_tags"' in s]), 1)
+        self.assertEqual(len([s for s in sql if 'INSERT INTO "app_article_tags"' in s]), 1)
+        self.assertEqual(len([s for s in sql if 'SAVEPOINT' in s and 'RELEASE' not in s]), 1)
+
+    def test_link_by_pk(self):
+        class LinkedTagField(NestedTagField):
+            class Meta(NestedTagField.Meta):
+                link_by_pk = True
+
+        class LinkedArticleSerializer(ArticleSerializer):
+            tags = LinkedTagField(many=True, allow_null=True)
+
+        ft = mommy.make(FeatureType)
+        article = mommy.make(Article, feature_type=ft)
+        tags = mommy.make(Tag, _quantity=3)
+        article.tags.add(tags[0])
+
+        payload = {
+            'title': article.title,
+            'feature_type': {'id': ft.pk},
+            'tags': [{'id': tag.pk} for tag in tags],
+            'unnecessary': None,
+            'authors': [],
+        }
+        serializer = LinkedArticleSerializer(article, data=payload)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+            serializer.save()
+
+        sql = [query['sql'] for query in queries]
+        # the tags are only checked for by pk, and never loaded
+        self.assertEqual(len([s for s in sql if 'FROM "app_tag"' in s]), 2)
+        self.assertTrue(all('"app_tag"."name"' not in s for s in sql))
+        self.assertEqual(len([s for s in sql if 'INSERT INTO "app_article_tags"' in s]), 1)
+        self.assertEqual(set(article.tags.all()), set(tags))
+
+        payload['tags'].append({'id': tags[-1].pk + 100})
+        serializer = LinkedArticleSerializer(article, data=payload)
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(serializer.errors['tags'][:3], [{}, {}, {}])
+        self.assertTrue(serializer.errors['tags'][3])
+
+    def test_lookups_only_load_used_columns(self):
+        class NestedArticleTitleField(NestedModelField):
+            class Meta(object):
+                model = Article
+                fields = ('id', 'title')
+
+        self.assertEqual(NestedArticleTitleField.get_lookup_columns(), ('id', 'title'))
+        # every column is used, so there's nothing to leave out
+        self.assertIsNone(NestedTagField.get_lookup_columns())
+
+        article = mommy.make(Article, feature_type=mommy.make(FeatureType))
+        field = NestedArticleTitleField()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(field.get_instance(article.pk).title, article.title)
+        self.assertNotIn('feature_type_id', queries[0]['sql'])
+
+    def test_sparse_fieldsets(self):
+        tags = mommy.make(Tag, _quantity=2)
+        for _ in range(3):
+            article = mommy.make(Article, feature_type=mommy.make(FeatureType))
+            article.tags.add(*tags)
+            Author.objects.create(name='some author', article=article)
+
+        url = reverse('api:article-list')
+        # one query, for the articles joined to their feature types
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'fields': 'id,title,feature_type.name'}, format='json')
+        self.assertEqual(response.data[2], {
+            'id': article.pk,
+            'title': article.title,
+            'feature_type': {'name': article.feature_type.name},
+        })
+
+        # the articles, then the tags (which are loaded with values_list, and no longer need their names)
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'omit': 'authors,tags.name,feature_type'}, format='json')
+        self.assertEqual(set(response.data[2]), set(['id', 'title', 'unnecessary', 'tags']))
+        self.assertEqual(response.data[2]['tags'], [{'id': tag.pk} for tag in tags])
+
+        serializer = ArticleSerializer(article, fields=['title', 'authors.name'])
+        self.assertEqual(serializer.data, {'title': article.title, 'authors': [{'name': 'some author'}]})
+
+        # writes get every field, whatever the query string says
+        payload = {
+            'title': 'new article', 'feature_type': {'id': article.feature_type.pk}, 'unnecessary': None,
+            'tags': [], 'authors': [],
+        }
+        response = self.client.post(url + '?fields=title', data=payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Article.objects.get(pk=response.data['id']).feature_type, article.feature_type)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_cached_representations(self):
+        class CachedFeatureTypeField(NestedFeatureTypeField):
+            class Meta(NestedFeatureTypeField.Meta):
+                cache_representation = True
+
+        class CachedTagField(NestedTagField):
+            class Meta(NestedTagField.Meta):
+                cache_representation = True
+
+        class CachedArticleSerializer(ArticleSerializer):
+            feature_type = CachedFeatureTypeField()
+            tags = CachedTagField(many=True, allow_null=True)
+
+        tags = mommy.make(Tag, _quantity=2)
+        for _ in range(3):
+            article = mommy.make(Article, feature_type=mommy.make(FeatureType))
+            article.tags.add(*tags)
+            Author.objects.create(name='some author', article=article)
+
+        def serialize():
+            queryset = CachedArticleSerializer.optimize_queryset(Article.objects.order_by('pk'))
+            return CachedArticleSerializer(queryset, many=True).data
+
+        expected = ArticleSerializer(Article.objects.order_by('pk'), many=True).data
+        # the articles, their authors and tag ids, then the tags and feature types that aren't cached yet
+        with self.assertNumQueries(5):
+            self.assertEqual(serialize(), expected)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(serialize(), expected)
+        self.assertEqual(len(queries), 3)
+        self.assertTrue(all('"app_featuretype"' not in query['sql'] for query in queries))
+
+        # saving throws the cached representation away
+        article.feature_type.name = 'renamed'
+        article.feature_type.save()
+        self.assertEqual(serialize()[2]['feature_type']['name'], 'renamed')
+
+        # and a list the queryset prefetched already is represented by what was prefetched
+        queryset = Article.objects.filter(pk=article.pk).prefetch_related(
+            Prefetch('tags', queryset=Tag.objects.filter(pk=tags[0].pk))
+        )
+        self.assertEqual(CachedArticleSerializer(queryset, many=True).data[0]['tags'], [expected[2]['tags'][0]])
+
+    def test_orphans(self):
+        class DeletingArticleSerializer(ArticleSerializer):
+            authors = NestedAuthorField(many=True, orphans=ORPHANS_DELETE)
+
+        article = mommy.make(Article, feature_type=mommy.make(FeatureType))
+        authors = [Author.objects.create(name='author {}'.format(i), article=article) for i in range(3)]
+        payload = ArticleSerializer(article).data
+        payload['authors'] = payload['authors'][:1]
+
+        # Author.article isn't nullable, so by default the left out authors are kept
+        serializer = ArticleSerializer(article, data=payload)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        serializer.save()
+        self.assertEqual(list(article.authors.order_by('pk')), authors)
+
+        serializer = DeletingArticleSerializer(article, data=payload)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        with CaptureQueriesContext(connection) as queries:
+            serializer.save()
+        self.assertEqual(list(article.authors.all()), authors[:1])
+        self.assertEqual(len([query for query in queries if 'DELETE FROM "app_author"' in query['sql']]), 1)
+
+        class NullingArticleSerializer(ArticleSerializer):
+            authors = NestedAuthorField(many=True, orphans=ORPHANS_NULL)
+
+        # which can't work for Author.article, as the serializer finds out when it's first used
+        with self.assertRaises(AssertionError):
+            NullingArticleSerializer(article).data
+
+    def test_unique_together(self):
+        feature_type = mommy.make(FeatureType)
+        article, other_article, third_article = mommy.make(Article, feature_type=feature_type, _quantity=3)
+        moving = Author.objects.create(name='some author', article=other_article)
+        also_moving = Author.objects.create(name='some author', article=third_article)
+        payload = ArticleSerializer(article).data
+
+        # two authors with the same name can't both move to the same article, and that's found without the db
+        payload['authors'] = [{'id': moving.pk}, {'id': also_moving.pk}]
+        serializer = ArticleSerializer(article, data=payload)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertFalse(serializer.is_valid())
+        self.assertEqual(serializer.errors['authors'], [
+            {}, {'non_field_errors': ['The fields name, article must make a unique set.']}
+        ])
+        self.assertFalse([query for query in queries if 'WHERE ("app_author"."name" =' in query['sql']])
+
+        author = Author.objects.create(name='some author', article=article)
+        # the article's current author is kept, since Author.article isn't nullable, so it clashes with the new one
+        payload['authors'] = [{'id': moving.pk}]
+        serializer = ArticleSerializer(article, data=payload)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertFalse(serializer.is_valid())
+        self.assertEqual(serializer.errors['authors'], [
+            {'non_field_errors': ['The fields name, article must make a unique set.']}
+        ])
+        self.assertEqual(len([query for query in queries if '"app_author"."name" =' in query['sql']]), 1)
+
+        # unless it's on its way out
+        class DeletingArticleSerializer(ArticleSerializer):
+            authors = NestedAuthorField(many=True, orphans=ORPHANS_DELETE)
+
+        serializer = DeletingArticleSerializer(article, data=payload)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        serializer.save()
+        self.assertEqual(list(article.authors.all()), [moving])
+        self.assertFalse(Author.objects.filter(pk=author.pk).exists())
+
+        # and authors that stay where they are aren't checked at all
+        payload['authors'] = [{'id': moving.pk}]
+        serializer = ArticleSerializer(article, data=payload)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertFalse([query for query in queries if '"app_author"."name" =' in query['sql']])
+
+    def test_field_template(self):
+        template = ArticleSerializer.get_field_template()
+        self.assertIs(ArticleSerializer.get_field_template(), template)
+
+        first, second = ArticleSerializer(), ArticleSerializer()
+        for name, field in template.items():
+            self.assertIsNot(first.fields[name], field)
+            self.assertIsNot(first.fields[name], second.fields[name])
+        self.assertIs(first.fields['authors'].child.parent, first.fields['authors'])
+        self.assertIs(first.fields['authors'].child.root, first)
+        self.assertIs(second.fields['authors'].child.root, second)
+
+        # they're copies, so changing one doesn't change the others
+        first.fields['title'].read_only = True
+        first.fields['title'].error_messages['blank'] = 'changed'
+        first.fields['title'].validators.append(lambda value: None)
+        for serializer in (second, ArticleSerializer()):
+            self.assertFalse(serializer.fields['title'].read_only)
+            self.assertNotEqual(serializer.fields['title'].error_messages['blank'], 'changed')
+            self.assertEqual(len(serializer.fields['title'].validators), len(template['title'].validators))
+
+        # serializers that build their fields their own way (from the context, say) don't get a template
+        class StaffTagSerializer(NestedModelSerializer):
+            class Meta:
+                model = Tag
+
+            def get_extra_kwargs(self):
+                extra_kwargs = dict(super(StaffTagSerializer, self).get_extra_kwargs())
+                if not self.context.get('staff'):
+                    extra_kwargs['name'] = {'read_only': True}
+                return extra_kwargs
+
+        self.assertFalse(StaffTagSerializer.uses_field_template())
+        self.assertTrue(StaffTagSerializer().fields['name'].read_only)
+        self.assertFalse(StaffTagSerializer(context={'staff': True}).fields['name'].read_only)
+
+    def test_write_plan(self):
+        plan = ArticleSerializer.get_write_plan()
+        self.assertIs(ArticleSerializer.get_write_plan(), plan)
+        self.assertEqual(plan.pk_name, 'id')
+
+        write_fields = dict((write_field.name, write_field) for write_field in plan.fields)
+        self.assertEqual(write_fields['title'].kind, SCALAR)
+        self.assertEqual(write_fields['feature_type'].kind, FK)
+        self.assertFalse(write_fields['feature_type'].null)
+        self.assertEqual(write_fields['unnecessary'].kind, FK)
+        self.assertTrue(write_fields['unnecessary'].null)
+        self.assertEqual(write_fields['tags'].kind, M2M)
+        self.assertEqual(write_fields['authors'].kind, REVERSE_FK)
+        self.assertEqual(write_fields['authors'].related_attname, 'article_id')
+
+    def test_null_for_non_nullable_fk(self):
+        class NullableArticleSerializer(NestedModelSerializer):
+            feature_type = NestedFeatureTypeField(allow_null=True)
+            unnecessary = NestedUnnecessaryField(allow_null=True)
+
+            class Meta:
+                model = Article
+                fields = ('id', 'title', 'feature_type', 'unnecessary')
+
+        article = Article.objects.create(title='some article', feature_type=mommy.make(FeatureType))
+        serializer = NullableArticleSerializer(article, data={
+            'title': 'some article', 'feature_type': None, 'unnecessary': None,
+        })
+        # Article.feature_type isn't nullable, which is a validation error rather than something save() finds out
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(serializer.errors, {'feature_type': ['This field may not be null.']})
+
+    def test_instrumentation(self):
+        ft = mommy.make(FeatureType)
+        article = mommy.make(Article, feature_type=ft)
+        article.tags.add(*mommy.make(Tag, _quantity=2))
+
+        url = reverse('api:article-detail', kwargs={'pk': article.pk})
+        payload = self.client.get(url, format='json').data
+        payload['tags'] = [{'id': mommy.make(Tag).pk}]
+
+        with instrumentation.record() as measurements:
+            update_response = self.client.put(url, data=payload, format='json')
+        self.assertEqual(update_response.status_code, 200)
+
+        measured = dict(((m.path, m.operation), m) for m in measurements)
+        self.assertIn(('ArticleSerializer', 'to_internal_value'), measured)
+        self.assertIn(('ArticleSerializer.tags[]', 'to_internal_value'), measured)
+        self.assertIn(('ArticleSerializer.tags', 'update'), measured)
+
+        update = measured[('ArticleSerializer', 'update')]
+        self.assertGreater(update.queries, 0)
+        self.assertGreaterEqual(update.wall_time, update.db_time)
+        self.assertFalse(connection.force_debug_cursor)
+
+        # nobody's listening any more, so nothing gets measured
+        count = len(measurements)
+        self.client.put(url, data=payload, format='json')
+        self.assertEqual(len(measurements), count)
+
+        # whoever is capturing queries outside of the measurement still sees them
+        article = Article.objects.get(pk=article.pk)
+        with instrumentation.record() as measurements, CaptureQueriesContext(connection) as captured:
+            ArticleSerializer(article).data
+        queries = measurements[-1].queries
+        self.assertGreater(queries, 0)
+        self.assertEqual(len(captured), queries)
+
+        # and a full query log (which rotates from then on) makes no difference to the count
+        self.addCleanup(connection.queries_log.clear)
+        connection.queries_log.extend({'sql': '', 'time': '0.000'} for _ in range(connection.queries_log.maxlen))
+        article = Article.objects.get(pk=article.pk)
+        with instrumentation.record() as measurements:
+            ArticleSerializer(article).data
+        self.assertEqual(measurements[-1].queries, queries)
+
+    def test_query_budget(self):
+        class BudgetedArticleSerializer(ArticleSerializer):
+            class Meta(ArticleSerializer.Meta):
+                query_budget = {'read': 3, 'write': 10}
+
+        feature_type = mommy.make(FeatureType)
+        for article in mommy.make(Article, feature_type=feature_type, _quantity=3):
+            article.tags.add(mommy.make(Tag))
+
+        # nothing's enforced until there's something to do about it
+        BudgetedArticleSerializer(Article.objects.all(), many=True).data
+
+        with override_settings(NESTED_SERIALIZERS_QUERY_BUDGET=instrumentation.BUDGET_RAISE):
+            # with the query plan applied, it's one query per prefetch
+            queryset = BudgetedArticleSerializer.optimize_queryset(Article.objects.all())
+            with self.assertRaises(instrumentation.QueryBudgetExceeded) as context:
+                BudgetedArticleSerializer(Article.objects.all(), many=True).data
+            self.assertEqual(len(BudgetedArticleSerializer(queryset, many=True).data), 3)
+
+        # without it, every article loads its own feature type
+        error = context.exception
+        self.assertEqual(error.budget, 3)
+        self.assertEqual(error.measurement.path, 'BudgetedArticleSerializer')
+        self.assertEqual(error.breakdown[('BudgetedArticleSerializer[].feature_type', 'get_attribute')], 3)
+        self.assertIn('BudgetedArticleSerializer[].feature_type get_attribute: 3 queries', str(error))
+
+        # a full query log doesn't let them off
+        self.addCleanup(connection.queries_log.clear)
+        connection.queries_log.extend({'sql': '', 'time': '0.000'} for _ in range(connection.queries_log.maxlen))
+        with override_settings(NESTED_SERIALIZERS_QUERY_BUDGET=instrumentation.BUDGET_RAISE):
+            with self.assertRaises(instrumentation.QueryBudgetExceeded):
+                BudgetedArticleSerializer(Article.objects.all(), many=True).data
+
+        with override_settings(NESTED_SERIALIZERS_QUERY_BUDGET=instrumentation.BUDGET_WARN):
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always')
+                BudgetedArticleSerializer(Article.objects.all(), many=True).data
+        self.assertEqual([warning.category for warning in caught], [instrumentation.QueryBudgetWarning])
+
+        # and the budget's held to the whole tree, not the articles one by one
+        with override_settings(NESTED_SERIALIZERS_QUERY_BUDGET=instrumentation.BUDGET_RAISE):
+            article = Article.objects.first()
+            payload = BudgetedArticleSerializer(article).data
+            payload['tags'] = [{'id': mommy.make(Tag).pk}]
+            serializer = BudgetedArticleSerializer(article, data=payload)
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+            serializer.save()
+
+        # each class's budget is looked up once, until the classes are cleared
+        BudgetedArticleSerializer.Meta.query_budget = {'read': 1}
+        with override_settings(NESTED_SERIALIZERS_QUERY_BUDGET=instrumentation.BUDGET_RAISE):
+            BudgetedArticleSerializer(queryset.all(), many=True).data
+            clear_nested_serializer_classes()
+            with self.assertRaises(instrumentation.QueryBudgetExceeded):
+                BudgetedArticleSerializer(queryset.all(), many=True).data
+
+    def test_missing_references(self):
+        article = mommy.make(Article, feature_type=mommy.make(FeatureType))
+        tag = mommy.make(Tag)
+        payload = ArticleSerializer(article).data
+        payload['tags'] = [{'id': tag.pk}, {'id': 9999}, {'id': 9998}]
+        payload['authors'] = [{'id': 9997}]
+        payload['feature_type'] = {'id': 9996}
+
+        serializer = ArticleSerializer(article, data=payload)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertFalse(serializer.is_valid())
+        self.assertEqual(serializer.errors, {
+            'tags': [{}, ['Tag matching query does not exist.'], ['Tag matching query does not exist.']],
+            'authors': [['Author matching query does not exist.']],
+            'feature_type': ['FeatureType matching query does not exist.'],
+        })
+        # one query per model, however many ids are missing
+        self.assertEqual(len(queries), 3)
+
+        url = reverse('api:article-detail', kwargs={'pk': article.pk})
+        response = self.client.put(url, data=payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data), set(['tags', 'authors', 'feature_type']))
+
+    def test_partial_update(self):
+        ft = mommy.make(FeatureType)
+        article = mommy.make(Article, feature_type=ft)
+        article.tags.add(*mommy.make(Tag, _quantity=2))
+        Author.objects.create(name='some author', article=article)
+        url = reverse('api:article-detail', kwargs={'pk': article.pk})
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(url, data={'title': 'patched'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['title'], 'patched')
+        self.assertEqual(len(response.data['tags']), 2)
+        sql = [query['sql'] for query in queries.captured_queries]
+        writes = [query for query in sql if any(verb in query for verb in ('UPDATE', 'INSERT', 'DELETE'))]
+        self.assertEqual(len(writes), 1)
+        self.assertIn('UPDATE "app_article" SET "title"', writes[0])
+
+        # pointing at the same feature type again doesn't even look it up
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(url, data={'feature_type': {'id': ft.pk}}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['feature_type'], {'id': ft.pk, 'name': ft.name})
+        self.assertFalse([query for query in queries.captured_queries if 'app_featuretype"."id" =' in query['sql']])
+        self.assertFalse([query for query in queries.captured_queries if 'UPDATE' in query['sql']])
+
+        other_ft = mommy.make(FeatureType)
+        response = self.client.patch(url, data={'feature_type': {'id': other_ft.pk}}, format='json')
+        self.assertEqual(response.data['feature_type'], {'id': other_ft.pk, 'name': other_ft.name})
+        self.assertEqual(Article.objects.get(pk=article.pk).feature_type, other_ft)
+
+        # an id that isn't one can't be taken for the (null) FK's current value
+        for bad_id in ('abc', None, []):
+            response = self.client.patch(url, data={'unnecessary': {'id': bad_id}}, format='json')
+            self.assertEqual(response.status_code, 400, bad_id)
+            self.assertIn('unnecessary', response.data)
+
+    def test_update_only_saves_changes(self):
+        ft = mommy.make(FeatureType)
+        article = mommy.make(Article, feature_type=ft)
+        article.tags.add(*mommy.make(Tag, _quantity=2))
+
+        url = reverse('api:article-detail', kwargs={'pk': article.pk})
+        payload = self.client.get(url, format='json').data
+
+        with CaptureQueriesContext(connection) as queries:
+            update_response = self.client.put(url, data=payload, format='json')
+        self.assertEqual(update_response.status_code, 200)
+        self.assertFalse([query for query in queries.captured_queries if 'UPDATE' in query['sql']])
+
+        payload['title'] = 'some new title'
+        with CaptureQueriesContext(connection) as queries:
+            update_response = self.client.put(url, data=payload, format='json')
+        self.assertEqual(update_response.data['title'], 'some new title')
+        updates = [query['sql'] for query in queries.captured_queries if 'UPDATE' in query['sql']]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('SET "title" = ', updates[0])
+        self.assertNotIn('feature_type_id', updates[0])
+
+    def test_streaming_list(self):
+        for _ in range(5):
+            article = mommy.make(Article, feature_type=mommy.make(FeatureType))
+            article.tags.add(*mommy.make(Tag, _quantity=2))
+            mommy.make(Author, article=article)
+
+        response = self.client.get(reverse('api:article-list'), format='json')
+
+        self.addCleanup(setattr, ArticleExportViewSet, 'stream_chunk_size', ArticleExportViewSet.stream_chunk_size)
+        ArticleExportViewSet.stream_chunk_size = 2
+
+        streaming_response = self.client.get(reverse('api:article-export-list'), format='json')
+        self.assertTrue(streaming_response.streaming)
+        # the articles, then the tags and authors for each of the three chunks
+        with self.assertNumQueries(7):
+            content = b''.join(streaming_response.streaming_content)
+
+        self.assertEqual(json.loads(content.decode('utf-8')), json.loads(response.content.decode('utf-8')))
+
+    def test_compiled_read(self):
+        self.assertEqual(NestedTagField.get_compiled_read(), (('id', 'id'), ('name', 'name')))
+
+        tags = mommy.make(Tag, _quantity=3)
+        for _ in range(2):
+            article = mommy.make(Article, feature_type=mommy.make(FeatureType))
+            article.tags.add(*tags)
+            Author.objects.create(name='some author', article=article)
+
+        constructed = []
+
+        def record_init(sender, **kwargs):
+            constructed.append(sender)
+
+        post_init.connect(record_init)
+        self.addCleanup(post_init.disconnect, record_init)
+
+        response = self.client.get(reverse('api:article-list'), format='json')
+        self.assertNotIn(Tag, constructed)
+        self.assertNotIn(Author, constructed)
+        self.assertEqual(response.data[0]['tags'], [{'id': tag.pk, 'name': tag.name} for tag in tags])
+        self.assertEqual(response.data[1]['authors'], [{'id': article.authors.get().pk, 'name': 'some author', 'article': article.pk}])
+
+        # a list the queryset prefetched already is rendered from what was prefetched, filtered or not
+        public = Tag.objects.create(name='public')
+        article.tags.add(public, Tag.objects.create(name='secret'))
+        queryset = Article.objects.filter(pk=article.pk).prefetch_related(
+            Prefetch('tags', queryset=Tag.objects.filter(name='public'))
+        )
+        with CaptureQueriesContext(connection) as queries:
+            data = ArticleSerializer(queryset, many=True).data
+        self.assertEqual(data[0]['tags'], [{'id': public.pk, 'name': 'public'}])
+        self.assertEqual(len([query for query in queries if 'FROM "app_tag"' in query['sql']]), 1)
+
+    def test_batch_create_and_update(self):
+        ft = mommy.make(FeatureType)
+        tags = mommy.make(Tag, _quantity=3)
+        payload = [{
+            'title': 'article {}'.format(i),
+            'feature_type': {'id': ft.pk},
+            'tags': [{'id': tag.pk} for tag in tags],
+            'unnecessary': None,
+            'authors': [],
+        } for i in range(4)]
+
+        serializer = ArticleSerializer(data=payload, many=True)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+            articles = serializer.save()
+
+        sql = [query['sql'] for query in queries]
+        # every tag and feature type is looked up once for the whole batch, and the m2m rows go in together
+        self.assertEqual(len([s for s in sql if 'FROM "app_tag"' in s]), 1)
+        self.assertEqual(len([s for s in sql if 'FROM "app_featuretype"' in s]), 1)
+        self.assertEqual(len([s for s in sql if 'INSERT INTO "app_article_tags"' in s]), 1)
+        self.assertEqual([article.title for article in articles], ['article {}'.format(i) for i in range(4)])
+        for article in articles:
+            self.assertEqual(list(article.tags.order_by('pk')), tags)
+
+        payload = ArticleSerializer(Article.objects.order_by('pk'), many=True).data
+        payload[0]['title'] = 'new title'
+        payload[1]['tags'] = payload[1]['tags'][:1]
+        payload.append(dict(payload[2], id=None, title='another article'))
+
+        serializer = ArticleSerializer(Article.objects.order_by('pk'), data=payload, many=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        articles = serializer.save()
+
+        self.assertEqual(Article.objects.count(), 5)
+        self.assertEqual(Article.objects.get(pk=articles[0].pk).title, 'new title')
+        self.assertEqual(list(Article.objects.get(pk=articles[1].pk).tags.all()), tags[:1])
+        self.assertEqual(articles[4].title, 'another article')
+        self.assertEqual(articles[4].tags.count(), 3)
+
+        payload[0]['id'] = 0
+        serializer = ArticleSerializer(Article.objects.order_by('pk'), data=payload[:1], many=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        with self.assertRaises(ValidationError):
+            serializer.save()
+
+        # a child that has its own create() gets it called for every new object in the batch
+        class ShoutingArticleSerializer(ArticleSerializer):
+            def create(self, validated_data):
+                validated_data['title'] = validated_data['title'].upper()
+                return super(ShoutingArticleSerializer, self).create(validated_data)
+
+        new_payload = [dict(payload[2], id=None, title='quiet article')]
+        serializer = ShoutingArticleSerializer(data=new_payload, many=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(serializer.save()[0].title, 'QUIET ARTICLE')
+
+        serializer = ShoutingArticleSerializer(Article.objects.order_by('pk'), data=new_payload, many=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(serializer.save()[0].title, 'QUIET ARTICLE')
+
 
 class QuizTests(TestCase):
     """tests complex serialization. other functionality is covered above.
@@ -229,3 +978,355 @@ class QuizTests(TestCase):
         }
 
         self.assertEqual(response, expected)
+
+    def test_identity_map_related_fields(self):
+        class QuizAnswerSerializer(NestedModelSerializer):
+            class Meta:
+                model = QuizAnswer
+
+        quiz = Quiz.objects.create(title='some quiz')
+        question = QuizQuestion.objects.create(text='herr derr', quiz=quiz)
+        outcome = QuizOutcome.objects.create(text='herr derr', quiz=quiz)
+
+        payload = [
+            {'text': 'answer {}'.format(i), 'question': question.pk, 'outcome': outcome.pk}
+            for i in range(5)
+        ]
+        serializer = QuizAnswerSerializer(data=payload, many=True)
+        # the question and the outcome only get loaded once each
+        with self.assertNumQueries(2):
+            self.assertTrue(serializer.is_valid())
+
+    def test_identity_map_respects_related_querysets(self):
+        class RestrictedAnswerSerializer(NestedModelSerializer):
+            class Meta:
+                model = QuizAnswer
+                extra_kwargs = {'outcome': {'queryset': QuizOutcome.objects.filter(text='allowed')}}
+
+        quiz = Quiz.objects.create(title='some quiz')
+        question = QuizQuestion.objects.create(text='herr derr', quiz=quiz)
+        allowed = QuizOutcome.objects.create(text='allowed', quiz=quiz)
+        forbidden = QuizOutcome.objects.create(text='forbidden', quiz=quiz)
+
+        for outcome, valid in ((allowed, True), (forbidden, False)):
+            serializer = RestrictedAnswerSerializer(data={'text': 'answer', 'question': question.pk, 'outcome': outcome.pk})
+            # the outcome's in the identity map already, which doesn't make it one the field accepts
+            serializer.context[IDENTITY_MAP_CONTEXT_KEY] = {(QuizOutcome, outcome.pk): outcome}
+            self.assertEqual(serializer.is_valid(), valid)
+        self.assertIn('outcome', serializer.errors)
+
+        # nor does the outcome get loaded up front, since the field would only look it up again with its queryset
+        serializer = RestrictedAnswerSerializer(data={'text': 'answer', 'question': question.pk, 'outcome': forbidden.pk})
+        with self.assertNumQueries(2):
+            self.assertFalse(serializer.is_valid())
+
+    def test_list_query_count_is_constant(self):
+        url = reverse('api:quiz-list')
+        for _ in range(3):
+            quiz = mommy.make(Quiz)
+            outcome = mommy.make(QuizOutcome, quiz=quiz)
+            for question in mommy.make(QuizQuestion, quiz=quiz, _quantity=3):
+                mommy.make(QuizAnswer, question=question, outcome=outcome, _quantity=2)
+
+        # quizzes, questions, answers and outcomes
+        with self.assertNumQueries(4):
+            response = self.client.get(url, format='json')
+        self.assertEqual(len(response.data), 3)
+        self.assertEqual(len(response.data[0]['question_set'][0]['answer_set']), 2)
+
+    def test_bulk_update_nested_list(self):
+        class BulkQuizAnswerSerializer(NestedModelSerializer):
+            class Meta:
+                model = QuizAnswer
+                bulk_writes = True
+
+        class QuizQuestionSerializer(NestedModelSerializer):
+            answer_set = BulkQuizAnswerSerializer(many=True)
+
+            class Meta:
+                model = QuizQuestion
+
+        quiz = Quiz.objects.create(title='some quiz')
+        question = QuizQuestion.objects.create(text='herr derr', quiz=quiz)
+        answers = [QuizAnswer.objects.create(text='answer {}'.format(i), question=question) for i in range(3)]
+
+        payload = {
+            'text': question.text,
+            'quiz': quiz.pk,
+            'answer_set': [
+                {'id': answers[0].pk, 'text': 'changed 0', 'question': question.pk, 'outcome': None},
+                {'id': answers[1].pk, 'text': 'changed 1', 'question': question.pk, 'outcome': None},
+                {'id': answers[2].pk, 'text': answers[2].text, 'question': question.pk, 'outcome': None},
+                {'text': 'new answer', 'question': question.pk, 'outcome': None},
+            ],
+        }
+        serializer = QuizQuestionSerializer(question, data=payload)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        with CaptureQueriesContext(connection) as queries:
+            serializer.save()
+
+        answer_updates = [
+            query['sql'] for query in queries.captured_queries
+            if 'UPDATE "app_quizanswer"' in query['sql']
+        ]
+        self.assertEqual(len(answer_updates), 1)
+        self.assertIn('"text"', answer_updates[0])
+        self.assertNotIn('"outcome_id"', answer_updates[0])
+        self.assertEqual(
+            sorted(question.answer_set.values_list('text', flat=True)),
+            ['answer 2', 'changed 0', 'changed 1', 'new answer']
+        )
+
+        # auto_now fields go along with any change, as they do when saving one at a time. None of the example
+        # models has one, so pretend outcome is
+        write_plan = BulkQuizAnswerSerializer.get_write_plan()
+        BulkQuizAnswerSerializer._write_plan = write_plan._replace(auto_now_fields=('outcome', ))
+        payload['answer_set'] = [
+            {'id': answer.pk, 'text': answer.text + '!', 'question': question.pk, 'outcome': None}
+            for answer in question.answer_set.all()
+        ]
+        serializer = QuizQuestionSerializer(question, data=payload)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        with CaptureQueriesContext(connection) as queries:
+            serializer.save()
+        answer_updates = [
+            query['sql'] for query in queries.captured_queries
+            if 'UPDATE "app_quizanswer"' in query['sql']
+        ]
+        self.assertEqual(len(answer_updates), 1)
+        self.assertIn('"outcome_id"', answer_updates[0])
+
+    def test_missing_references(self):
+        class QuestionSerializer(NestedModelSerializer):
+            answer_set = NestedQuizAnswerField(many=True)
+
+            class Meta:
+                model = QuizQuestion
+                fields = ('id', 'text', 'answer_set')
+
+        class QuizWriteSerializer(NestedModelSerializer):
+            question_set = QuestionSerializer(many=True)
+
+            class Meta:
+                model = Quiz
+                fields = ('id', 'title', 'question_set')
+
+        quiz = Quiz.objects.create(title='some quiz')
+        question = QuizQuestion.objects.create(quiz=quiz, text='some question')
+        answer = QuizAnswer.objects.create(question=question, text='some answer')
+        payload = {'title': 'some quiz', 'question_set': [
+            {'id': question.pk, 'text': 'some question', 'answer_set': [{'id': answer.pk}, {'id': 9999}]},
+            {'id': 9998, 'text': 'another question', 'answer_set': [{'id': 9997}]},
+        ]}
+
+        serializer = QuizWriteSerializer(quiz, data=payload)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertFalse(serializer.is_valid())
+        # every level's missing ids are reported together, having been looked up with one query per model
+        self.assertEqual(serializer.errors, {'question_set': [
+            {'answer_set': [{}, ['QuizAnswer matching query does not exist.']]},
+            {
+                'id': ['QuizQuestion matching query does not exist.'],
+                'answer_set': [['QuizAnswer matching query does not exist.']],
+            },
+        ]})
+        self.assertEqual(len(queries), 2)
+
+    def test_nested_ids_from_another_parent(self):
+        class QuestionSerializer(NestedModelSerializer):
+            class Meta:
+                model = QuizQuestion
+                fields = ('id', 'text')
+
+        class QuizWriteSerializer(NestedModelSerializer):
+            question_set = QuestionSerializer(many=True)
+
+            class Meta:
+                model = Quiz
+                fields = ('id', 'title', 'question_set')
+
+        quiz, other_quiz = Quiz.objects.create(title='some quiz'), Quiz.objects.create(title='other quiz')
+        question = QuizQuestion.objects.create(quiz=quiz, text='some question')
+        other_question = QuizQuestion.objects.create(quiz=other_quiz, text='other question')
+
+        # an id that exists but belongs to another quiz (submitted as a string, even) gets moved over to this one
+        serializer = QuizWriteSerializer(quiz, data={'title': 'some quiz', 'question_set': [
+            {'id': question.pk, 'text': 'some question'},
+            {'id': str(other_question.pk), 'text': 'moved question'},
+        ]})
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        serializer.save()
+        self.assertEqual(
+            list(quiz.question_set.order_by('pk').values_list('text', flat=True)), ['some question', 'moved question']
+        )
+        self.assertFalse(other_quiz.question_set.exists())
+
+    def test_default_named_reverse_fk(self):
+        class AnswerSerializer(NestedModelSerializer):
+            class Meta:
+                model = QuizAnswer
+                fields = ('id', 'text', 'question')
+
+        class OutcomeSerializer(NestedModelSerializer):
+            quizanswer_set = AnswerSerializer(many=True, required=False)
+
+            class Meta:
+                model = QuizOutcome
+                fields = ('id', 'text', 'quiz', 'quizanswer_set')
+
+        quiz = Quiz.objects.create(title='some quiz')
+        question = QuizQuestion.objects.create(quiz=quiz, text='some question')
+        answer = QuizAnswer.objects.create(question=question, text='answer 1')
+
+        # the reverse FK has no related_name, so it goes by `quizanswer_set` rather than its query name
+        serializer = OutcomeSerializer(data={'text': 'some outcome', 'quiz': quiz.pk, 'quizanswer_set': [
+            {'id': answer.pk, 'text': 'answer 1', 'question': question.pk},
+        ]})
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        outcome = serializer.save()
+        self.assertEqual(list(outcome.quizanswer_set.all()), [answer])
+
+        serializer = OutcomeSerializer(outcome, data={'text': 'some outcome', 'quiz': quiz.pk, 'quizanswer_set': [
+            {'id': answer.pk, 'text': 'changed', 'question': question.pk},
+            {'text': 'answer 2', 'question': question.pk},
+        ]})
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        serializer.save()
+        self.assertEqual(
+            sorted(outcome.quizanswer_set.values_list('text', flat=True)), ['answer 2', 'changed']
+        )
+
+        # Django keeps the prefetched answers under `quizanswer`, which is what the update has to forget
+        outcome = QuizOutcome.objects.prefetch_related('quizanswer_set').get(pk=outcome.pk)
+        serializer = OutcomeSerializer(outcome, data={'text': 'some outcome', 'quiz': quiz.pk, 'quizanswer_set': [
+            {'id': answer.pk, 'text': 'changed again', 'question': question.pk},
+        ]})
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        serializer.save()
+        self.assertEqual([item['text'] for item in serializer.data['quizanswer_set']], ['changed again'])
+
+        write_fields = dict((write_field.name, write_field) for write_field in OutcomeSerializer.get_write_plan().fields)
+        self.assertEqual(write_fields['quizanswer_set'].kind, REVERSE_FK)
+        self.assertEqual(write_fields['quizanswer_set'].related_attname, 'outcome_id')
+
+    def test_partial_update_keeps_prefetches(self):
+        quiz = Quiz.objects.create(title='some quiz')
+        QuizQuestion.objects.create(quiz=quiz, text='some question')
+        url = reverse('api:quiz-detail', kwargs={'pk': quiz.pk})
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(url, data={'title': 'patched'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['title'], 'patched')
+        self.assertEqual(len(response.data['question_set']), 1)
+        # the questions were prefetched along with the quiz, and the update didn't touch them
+        question_queries = [query for query in queries.captured_queries if 'FROM "app_quizquestion"' in query['sql']]
+        self.assertEqual(len(question_queries), 1)
+
+    def test_nested_serializer_classes_are_reused(self):
+        class QuizAnswerSerializer(NestedModelSerializer):
+            class Meta:
+                model = QuizAnswer
+                depth = 1
+
+        question_class = QuizAnswerSerializer().fields['question'].__class__
+        self.assertIs(QuizAnswerSerializer().fields['question'].__class__, question_class)
+        self.assertIsNot(QuizAnswerSerializer().fields['outcome'].__class__, question_class)
+
+        clear_nested_serializer_classes()
+        self.assertIsNot(QuizAnswerSerializer().fields['question'].__class__, question_class)
+
+    def test_clearing_forgets_class_plans(self):
+        class OutcomeSerializer(NestedModelSerializer):
+            class Meta:
+                model = QuizOutcome
+                fields = ('id', 'text')
+
+        self.assertEqual([write_field.name for write_field in OutcomeSerializer.get_write_plan().fields], ['id', 'text'])
+        OutcomeSerializer.Meta.fields = ('id', )
+        clear_nested_serializer_classes()
+        self.assertEqual([write_field.name for write_field in OutcomeSerializer.get_write_plan().fields], ['id'])
+        self.assertEqual(OutcomeSerializer.get_lookup_columns(), ('id', ))
+
+
+@skipUnless(sys.version_info >= (3, 5), "the async API needs python 3.5")
+class AsyncTests(TransactionTestCase):
+    """These run the ORM on other threads, whose connections can only see what's been committed"""
+
+    def setUp(self):
+        import asyncio
+        from nested_serializers import aio
+
+        class AsyncArticleSerializer(aio.AsyncNestedModelSerializer, ArticleSerializer):
+            pass
+
+        self.aio = aio
+        self.serializer_class = AsyncArticleSerializer
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_save(self):
+        article = mommy.make(Article, feature_type=mommy.make(FeatureType))
+        tags = mommy.make(Tag, _quantity=2)
+        author = Author.objects.create(name='some author', article=mommy.make(Article, feature_type=article.feature_type))
+
+        payload = ArticleSerializer(article).data
+        payload['title'] = 'changed'
+        payload['tags'] = [{'id': tag.pk} for tag in tags]
+        payload['authors'] = [{'id': author.pk}]
+        serializer = self.serializer_class(article, data=payload)
+
+        # every nested field's references are looked up before validation starts
+        self.loop.run_until_complete(serializer.aresolve_references())
+        self.assertEqual(
+            set(serializer.context[IDENTITY_MAP_CONTEXT_KEY]),
+            set([(Tag, tag.pk) for tag in tags] + [(Author, author.pk), (FeatureType, article.feature_type.pk)])
+        )
+
+        self.assertTrue(self.loop.run_until_complete(serializer.ais_valid()), serializer.errors)
+        self.loop.run_until_complete(serializer.asave())
+        article = Article.objects.get(pk=article.pk)
+        self.assertEqual(article.title, 'changed')
+        self.assertEqual(list(article.tags.order_by('pk')), tags)
+        self.assertEqual(list(article.authors.all()), [author])
+
+        serializer = self.serializer_class(data=[payload], many=True)
+        self.assertIsInstance(serializer, self.aio.AsyncNestedListSerializer)
+        payload['authors'] = [{'id': 0}]
+        with self.assertRaises(ValidationError):
+            self.loop.run_until_complete(serializer.ais_valid(raise_exception=True))
+
+    def test_viewset(self):
+        class AsyncArticleViewSet(self.aio.AsyncNestedModelMixin, ArticleViewSet):
+            serializer_class = self.serializer_class
+
+        article = mommy.make(Article, feature_type=mommy.make(FeatureType))
+        payload = ArticleSerializer(article).data
+        payload['title'] = 'changed'
+
+        view = AsyncArticleViewSet(action_map={'put': 'aupdate', 'post': 'acreate'})
+        request = view.initialize_request(APIRequestFactory().put('/', payload, format='json'))
+        view.request, view.args, view.kwargs, view.format_kwarg = request, (), {'pk': article.pk}, None
+        response = self.loop.run_until_complete(view.aupdate(request, pk=article.pk))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['title'], 'changed')
+        self.assertEqual(Article.objects.get(pk=article.pk).title, 'changed')
+
+        payload['title'] = 'a new article'
+        request = view.initialize_request(APIRequestFactory().post('/', payload, format='json'))
+        view.request, view.kwargs = request, {}
+        response = self.loop.run_until_complete(view.acreate(request))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Article.objects.get(pk=response.data['id']).title, 'a new article')
+
+
+class BenchmarkTests(TestCase):
+    def test_run(self):
+        results = benchmarks.run(articles=2, tags=3, authors=2, quizzes=2, questions=2, answers=2, repeat=1)
+        self.assertEqual(len(results), 8)
+        for result in results:
+            self.assertGreater(result['queries'], 0)
+            self.assertGreater(result['latency_median'], 0)
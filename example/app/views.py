@@ -1,19 +1,27 @@
+from nested_serializers import QueryPlanMixin, StreamingListMixin
 from rest_framework import routers, viewsets
 
 from .models import Article, Quiz
 from .serializers import ArticleSerializer, QuizSerializer
 
 
-class ArticleViewSet(viewsets.ModelViewSet):
+class ArticleViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     serializer_class = ArticleSerializer
     queryset = Article.objects.all()
 
 
-class QuizViewSet(viewsets.ModelViewSet):
+class ArticleExportViewSet(StreamingListMixin, QueryPlanMixin, viewsets.ReadOnlyModelViewSet):
+    serializer_class = ArticleSerializer
+    queryset = Article.objects.order_by('pk')
+    stream_chunk_size = 100
+
+
+class QuizViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     serializer_class = QuizSerializer
     queryset = Quiz.objects.all()
 
 
 router = routers.DefaultRouter(trailing_slash=True)
 router.register(r'articles', ArticleViewSet, base_name='article')
+router.register(r'article-export', ArticleExportViewSet, base_name='article-export')
 router.register(r'quizzes', QuizViewSet, base_name='quiz')
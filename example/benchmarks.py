@@ -0,0 +1,175 @@
+"""Benchmarks the read and write paths of the example viewsets over synthetic nested trees.
+
+    $ python -m example.benchmarks --tags 1000 --questions 100 --answers 10 --output bench.json
+
+A test database is created for the run, and every scenario runs `--repeat` times against it, reporting the number of
+queries and the latency per request, plus (where tracemalloc is available) the peak memory allocated by one extra,
+traced request. The scenarios share the database, so each one sees whatever the earlier ones wrote (the rows the
+POSTs create, for instance).
+"""
+import argparse
+import json
+import os
+import sys
+from timeit import default_timer
+
+try:
+    import tracemalloc
+except ImportError:  # python 2
+    tracemalloc = None
+
+
+def measure(func, trace=False):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    if trace:
+        tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            start = default_timer()
+            response = func()
+            latency = default_timer() - start
+        peak = tracemalloc.get_traced_memory()[1] if trace else None
+    finally:
+        if trace:
+            tracemalloc.stop()
+
+    assert response.status_code in (200, 201), response.data
+    return {"queries": len(queries), "latency": latency, "peak_memory": peak}
+
+
+def summarize(name, runs, traced=None):
+    latencies = sorted(run["latency"] for run in runs)
+    return {
+        "name": name,
+        "runs": len(runs),
+        "queries": max(run["queries"] for run in runs),
+        "latency_min": latencies[0],
+        "latency_median": latencies[len(latencies) // 2],
+        "latency_max": latencies[-1],
+        "peak_memory": traced["peak_memory"] if traced is not None else None,
+    }
+
+
+def make_articles(count, tags, authors):
+    from model_mommy import mommy
+    from example.app.models import Article, Author, FeatureType, Tag
+
+    feature_type = mommy.make(FeatureType)
+    tag_objects = mommy.make(Tag, _quantity=tags) if tags else []
+    articles = []
+    for _ in range(count):
+        article = mommy.make(Article, feature_type=feature_type)
+        article.tags.add(*tag_objects)
+        for i in range(authors):
+            Author.objects.create(name="author {}".format(i), article=article)
+        articles.append(article)
+    return articles
+
+
+def make_quizzes(count, questions, answers):
+    from example.app.models import Quiz, QuizAnswer, QuizOutcome, QuizQuestion
+
+    quizzes = []
+    for _ in range(count):
+        quiz = Quiz.objects.create(title="some quiz")
+        outcome = QuizOutcome.objects.create(quiz=quiz, text="some outcome")
+        for i in range(questions):
+            question = QuizQuestion.objects.create(quiz=quiz, text="question {}".format(i))
+            QuizAnswer.objects.bulk_create([
+                QuizAnswer(question=question, outcome=outcome, text="answer {}".format(j)) for j in range(answers)
+            ])
+        quizzes.append(quiz)
+    return quizzes
+
+
+def run(articles=10, tags=100, authors=10, quizzes=5, questions=20, answers=5, repeat=5):
+    """Runs every scenario against whatever database is currently set up, and returns the results"""
+    from django.core.urlresolvers import reverse
+    from rest_framework.test import APIClient
+    from example.app.models import Tag
+
+    client = APIClient()
+    results = []
+
+    def scenario(name, func):
+        runs = [measure(func) for _ in range(repeat)]
+        # tracing allocations slows everything down, so it gets a run of its own
+        traced = measure(func, trace=True) if tracemalloc is not None else None
+        results.append(summarize(name, runs, traced))
+
+    article = make_articles(articles, tags, authors)[0]
+    article_url = reverse("api:article-detail", kwargs={"pk": article.pk})
+    scenario("article-list GET", lambda: client.get(reverse("api:article-list"), format="json"))
+    scenario("article-detail GET", lambda: client.get(article_url, format="json"))
+
+    article_payload = client.get(article_url, format="json").data
+    scenario("article-detail PUT", lambda: client.put(article_url, data=article_payload, format="json"))
+
+    new_article_payload = {
+        "title": "a new article",
+        "feature_type": article_payload["feature_type"],
+        "unnecessary": None,
+        "tags": [{"id": pk} for pk in Tag.objects.values_list("pk", flat=True)],
+        "authors": [],
+    }
+    scenario("article-list POST", lambda: client.post(reverse("api:article-list"), data=new_article_payload, format="json"))
+
+    quiz = make_quizzes(quizzes, questions, answers)[0]
+    quiz_url = reverse("api:quiz-detail", kwargs={"pk": quiz.pk})
+    scenario("quiz-list GET", lambda: client.get(reverse("api:quiz-list"), format="json"))
+    scenario("quiz-detail GET", lambda: client.get(quiz_url, format="json"))
+
+    quiz_payload = client.get(quiz_url, format="json").data
+    scenario("quiz-detail PUT", lambda: client.put(quiz_url, data=quiz_payload, format="json"))
+
+    new_quiz_payload = {"title": "a new quiz", "question_set": [], "outcome_set": []}
+    scenario("quiz-list POST", lambda: client.post(reverse("api:quiz-list"), data=new_quiz_payload, format="json"))
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--articles", type=int, default=10, help="articles in the list endpoint")
+    parser.add_argument("--tags", type=int, default=100, help="tags on every article")
+    parser.add_argument("--authors", type=int, default=10, help="authors on every article")
+    parser.add_argument("--quizzes", type=int, default=5, help="quizzes in the list endpoint")
+    parser.add_argument("--questions", type=int, default=20, help="questions in every quiz")
+    parser.add_argument("--answers", type=int, default=5, help="answers to every question")
+    parser.add_argument("--repeat", type=int, default=5, help="times to run each scenario")
+    parser.add_argument("--output", help="where to write the results as JSON (defaults to stdout)")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "example.settings")
+    import django
+    django.setup()
+
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        results = run(
+            articles=args.articles, tags=args.tags, authors=args.authors,
+            quizzes=args.quizzes, questions=args.questions, answers=args.answers,
+            repeat=args.repeat,
+        )
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+    parameters = dict((key, value) for key, value in vars(args).items() if key != "output")
+    report = {"parameters": parameters, "results": results}
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        sys.stdout.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
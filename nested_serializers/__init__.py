@@ -1,4 +1,6 @@
 # backwards compat this sukka
+from . import instrumentation
 from .fields import NestedModelField
+from .mixins import QueryPlanMixin, StreamingListMixin
 from .serializers import NestedListSerializer, NestedModelSerializer
 from .validators import has_id_field
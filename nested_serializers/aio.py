@@ -0,0 +1,110 @@
+"""Awaitable counterparts of nested validation and saves, for code running on an asyncio event loop (python 3.5+).
+
+Django 1.8 has no async ORM, so rather than blocking the loop these run the regular, blocking versions on a thread
+pool. The lookups for each of a payload's nested fields are independent, so they're all issued at once before
+validation, which then finds everything in the identity map.
+
+    class ArticleSerializer(AsyncNestedModelSerializer):
+        ...
+
+    serializer = ArticleSerializer(article, data=payload)
+    if await serializer.ais_valid():
+        await serializer.asave()
+
+This module isn't imported by `nested_serializers` itself, since python 2 can't.
+"""
+import asyncio
+
+from django.db import close_old_connections
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.serializers import ListSerializer
+
+from .serializers import EXISTING_PKS_CONTEXT_KEY, NestedListSerializer, NestedModelSerializer, References
+
+# the concurrent.futures executor the blocking calls run on, where None is the event loop's default one
+executor = None
+
+
+def run_in_thread(func, *args, **kwargs):
+    """Returns a future for `func(*args, **kwargs)`, run on the executor. The thread's db connection is closed
+    afterwards, as it would be at the end of a request (unless it's persistent, with CONN_MAX_AGE).
+    """
+    def call():
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return asyncio.get_event_loop().run_in_executor(executor, call)
+
+
+class AsyncSerializerMixin(object):
+    """Adds `ais_valid`, `asave`, `acreate` and `aupdate` to a nested serializer (or list serializer)"""
+
+    async def aresolve_references(self):
+        """Loads everything `initial_data` refers to, with the lookups for every model running at once"""
+        serializer = self.child if isinstance(self, ListSerializer) else self
+        data = self.initial_data
+        items = data if isinstance(data, list) else [data]
+        if not isinstance(serializer, NestedModelSerializer):
+            return
+
+        # worked out up here, rather than racing each other in the threads
+        references = References()
+        serializer.collect_references(items, references)
+        serializer.identity_map, serializer.missing_pks
+        serializer.context.setdefault(EXISTING_PKS_CONTEXT_KEY, set())
+        await asyncio.gather(*[
+            run_in_thread(serializer.load_references, ModelClass, references) for ModelClass in references.models()
+        ])
+
+    async def ais_valid(self, raise_exception=False):
+        await self.aresolve_references()
+        return await run_in_thread(self.is_valid, raise_exception=raise_exception)
+
+    async def asave(self, **kwargs):
+        return await run_in_thread(self.save, **kwargs)
+
+    async def acreate(self, validated_data):
+        return await run_in_thread(self.create, validated_data)
+
+    async def aupdate(self, instance, validated_data):
+        return await run_in_thread(self.update, instance, validated_data)
+
+    async def adata(self):
+        """`data`, which has its own queries to run"""
+        return await run_in_thread(getattr, self, "data")
+
+
+class AsyncNestedListSerializer(AsyncSerializerMixin, NestedListSerializer):
+    pass
+
+
+class AsyncNestedModelSerializer(AsyncSerializerMixin, NestedModelSerializer):
+    list_serializer_class = AsyncNestedListSerializer
+
+
+class AsyncNestedModelMixin(object):
+    """Awaitable counterparts of DRF's create and update actions, for viewsets whose serializer is an
+    `AsyncNestedModelSerializer` and that get dispatched from an event loop. `perform_create` and `perform_update` are
+    run on the thread pool, so overriding them works as usual.
+    """
+
+    async def acreate(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        await serializer.ais_valid(raise_exception=True)
+        await run_in_thread(self.perform_create, serializer)
+        data = await serializer.adata()
+        return Response(data, status=status.HTTP_201_CREATED, headers=self.get_success_headers(data))
+
+    async def aupdate(self, request, *args, **kwargs):
+        partial = kwargs.pop("partial", False)
+        instance = await run_in_thread(self.get_object)
+        serializer = self.get_serializer(instance, data=request.data, partial=partial)
+        await serializer.ais_valid(raise_exception=True)
+        await run_in_thread(self.perform_update, serializer)
+        return Response(await serializer.adata())
+
+    async def apartial_update(self, request, *args, **kwargs):
+        kwargs["partial"] = True
+        return await self.aupdate(request, *args, **kwargs)
@@ -0,0 +1,70 @@
+"""Caches the representations of nested serializers that ask for it (`Meta.cache_representation = True`).
+
+Each instance's representation is kept in the default Django cache, keyed by the serializer class, the model and the
+pk. Entries are deleted whenever an instance of the model is saved or deleted, as well as when the bulk writes in
+this package (which don't send signals) touch its rows.
+"""
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db.models.signals import post_delete, post_save
+
+CACHE_ALIAS = DEFAULT_CACHE_ALIAS
+
+
+class CachedRepresentation(object):
+    """Stands in for a related instance whose representation came out of the cache"""
+
+    def __init__(self, representation):
+        self.representation = representation
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def get_cache_key(serializer_class, model, pk):
+    opts = model._meta.concrete_model._meta
+    return "nested_serializers:{}.{}:{}.{}:{}".format(
+        serializer_class.__module__, serializer_class.__name__, opts.app_label, opts.model_name, pk
+    )
+
+
+# concrete model -> the serializer classes that cache its representations
+_caching_serializers = {}
+
+
+def register(serializer_class):
+    """Keeps track of serializer classes that cache their representations (`Meta.cache_representation = True`), so
+    that saving or deleting an instance of their model can invalidate what they've cached. It's called for every
+    `NestedModelSerializer` subclass as it's created.
+    """
+    meta = getattr(serializer_class, "Meta", None)
+    if not getattr(meta, "cache_representation", False) or getattr(meta, "model", None) is None:
+        return
+
+    model = meta.model._meta.concrete_model
+    _caching_serializers.setdefault(model, []).append(serializer_class)
+    # only for this model, since listening to every deletion stops django from fast deleting anything
+    post_delete.connect(invalidate_instance, sender=model, dispatch_uid="nested_serializers.cache.invalidate_instance")
+
+
+def get_caching_serializers(model):
+    """Returns every serializer class that caches the representations of `model`"""
+    return _caching_serializers.get(model._meta.concrete_model, [])
+
+
+def invalidate(model, pks):
+    """Forgets the cached representations of these instances"""
+    serializer_classes = get_caching_serializers(model)
+    if serializer_classes and pks:
+        get_cache().delete_many([
+            get_cache_key(serializer_class, model, pk) for serializer_class in serializer_classes for pk in pks
+        ])
+
+
+def invalidate_instance(sender, instance, **kwargs):
+    invalidate(sender, [instance.pk])
+
+
+# instances loaded with only() are saved as their deferred class, so post_save has to be listened to for everything
+post_save.connect(invalidate_instance, dispatch_uid="nested_serializers.cache.invalidate_instance")
@@ -1,5 +1,8 @@
+from rest_framework.fields import SkipField
+from rest_framework.serializers import ValidationError
 from rest_framework.validators import UniqueTogetherValidator
 
+from .instrumentation import instrumented
 from .serializers import NestedModelSerializer
 from .validators import has_id_field
 
@@ -9,19 +12,52 @@ class NestedModelField(NestedModelSerializer):
         validators = (has_id_field, )
 
     def __init__(self, *args, **kwargs):
-        """removes UniqueTogetherValidator because it's shit code - it's enforced by the db anyway
-        """
         super(NestedModelField, self).__init__(*args, **kwargs)
+        self._prefetched_instances = None
+
+    def get_validators(self):
+        """removes UniqueTogetherValidator because it's shit code - it's enforced by the db anyway. this happens
+        when the validators are first needed, since working them out means building all of the fields
+        """
         validators = []
-        for validator in self.validators:
+        for validator in super(NestedModelField, self).get_validators():
             if not isinstance(validator, UniqueTogetherValidator):
                 validators.append(validator)
-        self.validators = validators
+        return validators
+
+    def collect_references(self, items, references):
+        """Nothing but the id of a nested model field is read, and our parent has collected that already"""
+
+    def prefetch_instances(self, data):
+        """grabs every instance referenced by a list payload in a single query
+        """
+        self._prefetched_instances = self.get_instances([
+            item['id'] for item in data if isinstance(item, dict) and item.get('id') is not None
+        ])
+
+    def clear_prefetched_instances(self):
+        self._prefetched_instances = None
 
+    @instrumented("to_internal_value")
     def to_internal_value(self, data):
         if 'id' not in data:
             return None
+
+        pk = self.to_pk(data['id'])
+        if pk is not None and pk == self.get_current_pk():
+            # a partial update pointing at what's there already, which doesn't need looking up or writing
+            raise SkipField()
+
+        ModelClass = self.Meta.model
+        if self._prefetched_instances is not None:
+            pk = self.to_pk(data['id'])
+            if pk is not None:
+                try:
+                    return self._prefetched_instances[pk]
+                except KeyError:
+                    raise ValidationError("{} matching query does not exist.".format(ModelClass._meta.object_name))
+
         try:
-            return self.Meta.model.objects.get(pk=data['id'])
-        except self.Meta.model.DoesNotExist as exc:
-            return str(exc)
+            return self.get_instance(data['id'])
+        except ModelClass.DoesNotExist as exc:
+            raise ValidationError(str(exc))
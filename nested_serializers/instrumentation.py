@@ -0,0 +1,251 @@
+"""Optional query and timing measurements for nested serializer operations.
+
+Nothing is measured until a collector is added. A collector is any callable that takes a `Measurement`:
+
+    from nested_serializers import instrumentation
+
+    instrumentation.add_collector(lambda measurement: statsd.timing(measurement.path, measurement.wall_time))
+
+`send_signal` is a collector that sends the `operation_measured` signal, for anyone who would rather listen for that.
+
+Serializers can also declare a query budget, e.g. `Meta.query_budget = {"read": 4, "validate": 2, "write": 10}`, which
+is checked whenever they're measured, if the `NESTED_SERIALIZERS_QUERY_BUDGET` setting says what to do about going
+over it: BUDGET_LOG, BUDGET_WARN or BUDGET_RAISE.
+"""
+import functools
+import logging
+import threading
+import warnings
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+from timeit import default_timer
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connections
+from django.dispatch import Signal, receiver
+from rest_framework.serializers import ListSerializer
+
+Measurement = namedtuple("Measurement", ["path", "operation", "queries", "db_time", "wall_time"])
+
+operation_measured = Signal(providing_args=["measurement"])
+
+logger = logging.getLogger(__name__)
+
+BUDGET_LOG = "log"
+BUDGET_WARN = "warn"
+BUDGET_RAISE = "raise"
+
+# the operations each key of `Meta.query_budget` covers
+BUDGET_OPERATIONS = {
+    "read": ("to_representation", ),
+    "validate": ("to_internal_value", ),
+    "write": ("create", "update"),
+}
+
+
+class QueryBudgetExceeded(Exception):
+    def __init__(self, report, measurement, budget, breakdown):
+        super(QueryBudgetExceeded, self).__init__(report)
+        self.measurement = measurement
+        self.budget = budget
+        self.breakdown = breakdown
+
+
+class QueryBudgetWarning(RuntimeWarning):
+    pass
+
+
+_collectors = []
+
+# the measurements taken under each budgeted operation that's running, innermost last
+_budgets = threading.local()
+
+# what the `NESTED_SERIALIZERS_QUERY_BUDGET` setting says to do, looked up once (`_unset` until then)
+_unset = object()
+_budget_action = _unset
+
+# each serializer class's query budget by operation, since every row and nested field asks for it
+_class_budgets = {}
+
+
+def add_collector(collector):
+    if collector not in _collectors:
+        _collectors.append(collector)
+
+
+def remove_collector(collector):
+    if collector in _collectors:
+        _collectors.remove(collector)
+
+
+def send_signal(measurement):
+    operation_measured.send(sender=measurement.__class__, measurement=measurement)
+
+
+@contextmanager
+def record():
+    """Collects every measurement taken inside the block into the list it yields"""
+    measurements = []
+    add_collector(measurements.append)
+    try:
+        yield measurements
+    finally:
+        remove_collector(measurements.append)
+
+
+def get_path(serializer):
+    """Names a serializer by where it sits in the tree, e.g. `QuizSerializer.question_set[].answer_set`"""
+    parts = []
+    node = serializer
+    while node.parent is not None:
+        parts.append("[]" if isinstance(node.parent, ListSerializer) else "." + node.field_name)
+        node = node.parent
+
+    if isinstance(node, ListSerializer):
+        root_name = node.child.__class__.__name__
+    else:
+        root_name = node.__class__.__name__
+    return root_name + "".join(reversed(parts))
+
+
+def get_budget_action():
+    global _budget_action
+    if _budget_action is _unset:
+        _budget_action = getattr(settings, "NESTED_SERIALIZERS_QUERY_BUDGET", None)
+    return _budget_action
+
+
+@receiver(setting_changed)
+def reset_budget_action(setting, **kwargs):
+    global _budget_action
+    if setting == "NESTED_SERIALIZERS_QUERY_BUDGET":
+        _budget_action = _unset
+
+
+def get_class_budget(serializer_class):
+    """Returns the queries `Meta.query_budget` allows each operation of the class, e.g. `{"create": 10}`"""
+    try:
+        return _class_budgets[serializer_class]
+    except KeyError:
+        pass
+
+    budget = getattr(getattr(serializer_class, "Meta", None), "query_budget", None) or {}
+    operation_budgets = _class_budgets[serializer_class] = dict(
+        (operation, budget[key])
+        for key, operations in BUDGET_OPERATIONS.items() if budget.get(key) is not None
+        for operation in operations
+    )
+    return operation_budgets
+
+
+def clear_class_budgets():
+    _class_budgets.clear()
+
+
+def get_query_budget(serializer, operation):
+    """Returns how many queries the serializer's `Meta.query_budget` allows `operation`, or None. A top-level list
+    is held to its child's budget, for the whole list, and answers for its children; nested lists leave it to theirs.
+    """
+    parent = serializer.parent
+    if isinstance(serializer, ListSerializer):
+        if parent is not None:
+            return None
+        serializer = serializer.child
+    elif isinstance(parent, ListSerializer) and parent.parent is None:
+        return None
+
+    return get_class_budget(serializer.__class__).get(operation)
+
+
+def get_breakdown(measurements):
+    """Adds up the queries of the measurements by path and operation, most queries first. Each one includes the
+    queries of whatever is nested under it.
+    """
+    breakdown = OrderedDict()
+    for measurement in measurements:
+        key = (measurement.path, measurement.operation)
+        breakdown[key] = breakdown.get(key, 0) + measurement.queries
+    return OrderedDict(
+        (key, queries) for key, queries in sorted(breakdown.items(), key=lambda item: -item[1]) if queries
+    )
+
+
+def enforce_query_budget(measurement, budget, nested, action):
+    breakdown = get_breakdown(nested)
+    report = "{} {} ran {} queries, over its budget of {}".format(
+        measurement.path, measurement.operation, measurement.queries, budget
+    )
+    report += "".join(
+        "\n    {} {}: {} queries".format(path, operation, queries)
+        for (path, operation), queries in breakdown.items()
+    )
+
+    if action == BUDGET_RAISE:
+        raise QueryBudgetExceeded(report, measurement, budget, breakdown)
+    elif action == BUDGET_WARN:
+        warnings.warn(report, QueryBudgetWarning)
+    else:
+        logger.warning(report)
+
+
+def instrumented(operation):
+    """Measures the decorated serializer method whenever there's somebody to tell about it, or a query budget to
+    hold it to
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            # checked first and cheaply, as this runs for every row and nested field
+            action = get_budget_action()
+            budgets = getattr(_budgets, "stack", None)
+            if action is not None:
+                budget = get_query_budget(self, operation)
+                if budget is None:
+                    action = None
+            if not _collectors and action is None and not budgets:
+                return method(self, *args, **kwargs)
+
+            if budgets is None:
+                budgets = _budgets.stack = []
+            if action is not None:
+                nested = []
+                budgets.append(nested)
+
+            # the debug cursor is what tells us about each query (its sql and how long it took). It gets a log of
+            # its own for the call, since the connection's is capped (and rotates once it's full)
+            logs = []
+            for connection in connections.all():
+                logs.append((connection, connection.force_debug_cursor, connection.queries_log))
+                connection.force_debug_cursor = True
+                connection.queries_log = []
+
+            start = default_timer()
+            try:
+                result = method(self, *args, **kwargs)
+            finally:
+                wall_time = default_timer() - start
+                queries, db_time = 0, 0.0
+                for connection, force_debug_cursor, queries_log in logs:
+                    new_queries = connection.queries_log
+                    connection.force_debug_cursor = force_debug_cursor
+                    connection.queries_log = queries_log
+                    if connection.queries_logged:
+                        # whoever was logging queries already (an outer measurement, say) still gets to see these
+                        queries_log.extend(new_queries)
+                    queries += len(new_queries)
+                    db_time += sum(float(query["time"]) for query in new_queries)
+
+                measurement = Measurement(get_path(self), operation, queries, db_time, wall_time)
+                if action is not None:
+                    budgets.pop()
+                for measurements in budgets:
+                    measurements.append(measurement)
+                for collector in list(_collectors):
+                    collector(measurement)
+
+            if action is not None and measurement.queries > budget:
+                enforce_query_budget(measurement, budget, nested, action)
+            return result
+        return wrapper
+    return decorator
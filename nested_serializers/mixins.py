@@ -0,0 +1,55 @@
+from django.http import StreamingHttpResponse
+
+from .renderers import StreamingJSONRenderer
+from .serializers import NestedListSerializer, NestedModelSerializer, apply_query_plan
+
+
+class QueryPlanMixin(object):
+    """Applies the serializer's query plan to `get_queryset()`, so that nested fields and reverse sets
+    don't cost a query per row.
+    """
+
+    def get_queryset(self):
+        queryset = super(QueryPlanMixin, self).get_queryset()
+        serializer_class = self.get_serializer_class()
+        if issubclass(serializer_class, NestedModelSerializer):
+            serializer = serializer_class(context=self.get_serializer_context())
+            if serializer.sparse_fieldset is None:
+                queryset = serializer_class.optimize_queryset(queryset)
+            else:
+                # only what the sparse fieldset asked for needs loading
+                queryset = apply_query_plan(queryset, serializer.build_query_plan())
+        return queryset
+
+    def perform_update(self, serializer):
+        super(QueryPlanMixin, self).perform_update(serializer)
+        # anything we prefetched for the instance is stale now (nested serializers only forget what they wrote)
+        if not isinstance(serializer, NestedModelSerializer) and \
+                getattr(serializer.instance, "_prefetched_objects_cache", None):
+            serializer.instance._prefetched_objects_cache = {}
+
+
+class StreamingListMixin(object):
+    """Streams list responses as JSON, serializing the queryset a chunk at a time so memory use stays flat however
+    many rows there are. Paginated lists are left alone.
+    """
+    stream_chunk_size = None
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        serializer = self.get_serializer(queryset, many=True)
+        if not isinstance(serializer, NestedListSerializer):
+            return super(StreamingListMixin, self).list(request, *args, **kwargs)
+
+        items = serializer.iter_representation(queryset, chunk_size=self.stream_chunk_size)
+        renderer = StreamingJSONRenderer()
+        return StreamingHttpResponse(
+            renderer.render_stream(items, renderer_context=self.get_renderer_context()),
+            content_type=renderer.media_type
+        )
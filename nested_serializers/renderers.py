@@ -0,0 +1,13 @@
+from rest_framework.renderers import JSONRenderer
+
+
+class StreamingJSONRenderer(JSONRenderer):
+    """Renders a JSON list an item at a time, for use with a StreamingHttpResponse"""
+
+    def render_stream(self, items, accepted_media_type=None, renderer_context=None):
+        yield b"["
+        for index, item in enumerate(items):
+            if index:
+                yield b","
+            yield self.render(item, accepted_media_type, renderer_context)
+        yield b"]"
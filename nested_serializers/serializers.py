@@ -1,19 +1,528 @@
-from django.db import transaction
+import copy
+from collections import OrderedDict, namedtuple
+from itertools import islice
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.db import models, router, transaction
+from django.db.models import Case, F, Prefetch, Value, When
+from django.db.models.query import QuerySet, prefetch_related_objects
+from django.db.models.sql.datastructures import EmptyResultSet
+from django.utils import six
 
 from rest_framework import serializers
 from rest_framework.fields import set_value, empty
-from rest_framework.compat import OrderedDict
-from rest_framework.serializers import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.serializers import ValidationError, raise_errors_on_nested_writes
 from rest_framework.utils import model_meta
 from rest_framework.utils.field_mapping import get_nested_relation_kwargs
 
+from .cache import DEFAULT_TIMEOUT, CachedRepresentation, get_cache, get_cache_key, invalidate, register
+from .instrumentation import clear_class_budgets, instrumented
+from .unit_of_work import UNIT_OF_WORK_CONTEXT_KEY, deferred_writes
+
+# the key in the root serializer's context that holds the shared identity map
+IDENTITY_MAP_CONTEXT_KEY = "nested_identity_map"
+
+# the key in the root serializer's context that holds the (model, pk) pairs known to exist
+EXISTING_PKS_CONTEXT_KEY = "nested_existing_pks"
+
+# the key in the root serializer's context that holds the (model, pk) pairs known not to exist
+MISSING_PKS_CONTEXT_KEY = "nested_missing_pks"
+
+# the classes made by `NestedModelSerializer.build_nested_field`, keyed by (parent serializer class, related model,
+# depth), so that building a serializer's fields doesn't mean making brand new classes every time
+_nested_serializer_classes = {}
+
+# serializer class -> its unbound fields, see `NestedModelSerializer.get_field_template`
+_field_templates = {}
+
+
+# what NestedModelSerializer works out once per class and keeps on it
+CLASS_CACHE_ATTRS = ("_write_plan", "_query_plan", "_lookup_columns", "_compiled_read")
+
+
+def clear_nested_serializer_classes():
+    """Forgets every class generated by `build_nested_field`, along with the field templates using them, and whatever
+    each serializer class has worked out about itself (handy in tests, or after changing a serializer's `Meta`)
+    """
+    _nested_serializer_classes.clear()
+    _field_templates.clear()
+    clear_class_budgets()
+
+    classes = [NestedModelSerializer]
+    while classes:
+        cls = classes.pop()
+        for attr in CLASS_CACHE_ATTRS:
+            if attr in cls.__dict__:
+                delattr(cls, attr)
+        classes.extend(cls.__subclasses__())
+
+
+def is_unrestricted(queryset):
+    """Whether a queryset can return any row of its model, i.e. it's filtered no more than the default manager is.
+    The identity map holds whatever exists, so only a field with such a queryset can take its instances from there.
+    """
+    default = queryset.model._default_manager.all()
+    if queryset.query.low_mark or queryset.query.high_mark is not None:
+        return False
+    if not queryset.query.where.children and not default.query.where.children:
+        return True
+    try:
+        return str(queryset.query) == str(default.query)
+    except EmptyResultSet:
+        return False
+
+
+class NestedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """A PrimaryKeyRelatedField that reads from (and fills) the tree's identity map. Fields with a restricted queryset
+    still look their instances up with it.
+    """
+
+    def to_internal_value(self, data):
+        queryset = self.get_queryset()
+        ModelClass = queryset.model
+        try:
+            key = (ModelClass, ModelClass._meta.pk.to_python(data))
+        except (DjangoValidationError, TypeError, ValueError):
+            return super(NestedPrimaryKeyRelatedField, self).to_internal_value(data)
+
+        identity_map = self.context.setdefault(IDENTITY_MAP_CONTEXT_KEY, {})
+        if key in identity_map and is_unrestricted(queryset):
+            return identity_map[key]
+        return identity_map.setdefault(key, super(NestedPrimaryKeyRelatedField, self).to_internal_value(data))
+
+
+# how each field of a NestedModelSerializer gets written
+SCALAR = "scalar"
+FK = "fk"
+REVERSE_FK = "reverse_fk"
+M2M = "m2m"
+
+WriteField = namedtuple("WriteField", ["name", "source", "kind", "null", "related_attname", "model_field", "reverse"])
+WritePlan = namedtuple("WritePlan", ["pk_name", "fields", "columns", "auto_now_fields"])
+
+# what a nested reverse FK list does with the children an update leaves out of it
+ORPHANS_KEEP = "keep"
+ORPHANS_DELETE = "delete"
+ORPHANS_NULL = "null"
+
+# the serializer fields whose representation is just the column's value, so a compiled read can skip them
+COMPILED_READ_FIELDS = (
+    serializers.BooleanField,
+    serializers.CharField,
+    serializers.FloatField,
+    serializers.IntegerField,
+    serializers.NullBooleanField,
+    serializers.PrimaryKeyRelatedField,
+    NestedPrimaryKeyRelatedField,
+)
+
+# where the rows loaded for compiled reads get stashed on each parent instance, keyed by field source
+COMPILED_VALUES_ATTR = "_nested_compiled_values"
+
+# likewise for representations that came out of (or just went into) the cache
+CACHED_REPRESENTATIONS_ATTR = "_nested_cached_representations"
+
+
+def parse_fieldset(value):
+    """Turns a fieldset like "id,title,feature_type.name" (or a list of the same) into a tree of field names:
+    {"id": None, "title": None, "feature_type": {"name": None}}. None means the whole field.
+    """
+    if isinstance(value, str) or not hasattr(value, "__iter__"):
+        value = value.split(",")
+
+    tree = {}
+    for path in value:
+        parts = [part.strip() for part in path.split(".") if part.strip()]
+        node = tree
+        for part in parts[:-1]:
+            if part in node and node[part] is None:
+                # the whole field is already in there
+                break
+            node = node.setdefault(part, {})
+        else:
+            if parts:
+                node[parts[-1]] = None
+    return tree
+
+
+def get_relation_field(ModelClass, name):
+    """Returns `(model_field, reverse)` for one of ModelClass's relations, going by DRF's name for it. That's the FK or
+    m2m itself for a forward relation. Reverse ones are named by their accessor (like `quizanswer_set`), which
+    `_meta.get_field` doesn't know, so it's the related model's field that points back at us. `(None, False)` if
+    there's no such relation.
+    """
+    opts = ModelClass._meta
+    try:
+        model_field = opts.get_field(name)
+    except FieldDoesNotExist:
+        model_field = None
+    if model_field is not None and model_field.concrete:
+        return (model_field, False) if model_field.is_relation else (None, False)
+
+    for rel in opts.related_objects:
+        if rel.get_accessor_name() == name:
+            return rel.field, True
+    return None, False
+
+
+def get_prefetch_cache_name(model_field, reverse):
+    """The key a to-many relation's prefetched objects are kept under in `_prefetched_objects_cache`: the m2m's name
+    for a forward one, and the related query name (`quizanswer`, rather than the `quizanswer_set` accessor) for a
+    reverse one
+    """
+    return model_field.related_query_name() if reverse else model_field.name
+
+
+def get_prefetch_lookups(plan, prefix=""):
+    """Flattens the prefetches in a query plan into a list of lookups. Nested prefetches are expressed
+    as lookups through their parent, rather than as Prefetch querysets that prefetch themselves, which
+    Django happily evaluates twice.
+    """
+    lookups = []
+    for lookup, related_model, subplan in plan["prefetch_related"]:
+        lookup = prefix + lookup
+        if subplan is None:
+            lookups.append(lookup)
+            continue
+
+        if subplan["select_related"]:
+            # Prefetch objects get mutated while they're being used, so build fresh ones every time
+            queryset = related_model._default_manager.select_related(*subplan["select_related"])
+            lookups.append(Prefetch(lookup, queryset=queryset))
+        else:
+            lookups.append(lookup)
+        lookups.extend(get_prefetch_lookups(subplan, prefix=lookup + "__"))
+    return lookups
+
+
+def apply_query_plan(queryset, plan):
+    """Applies a plan built by `NestedModelSerializer.get_query_plan` to a queryset"""
+    if plan["select_related"]:
+        queryset = queryset.select_related(*plan["select_related"])
+
+    lookups = get_prefetch_lookups(plan)
+    if lookups:
+        queryset = queryset.prefetch_related(*lookups)
+    return queryset
+
+
+def iter_chunks(iterable, chunk_size):
+    """Yields lists of up to `chunk_size` objects. Querysets are read without caching every object, and have their
+    prefetches run a chunk at a time.
+    """
+    lookups = []
+    if isinstance(iterable, QuerySet):
+        lookups = list(iterable._prefetch_related_lookups)
+        # iterator() ignores prefetch_related, so we do it ourselves
+        iterable = iterable.prefetch_related(None).iterator()
+
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        if lookups:
+            prefetch_related_objects(chunk, lookups)
+        yield chunk
+
+
+class References(object):
+    """The ids a payload refers to, by model, as collected by `NestedModelSerializer.collect_references`"""
+
+    def __init__(self):
+        # model -> pks whose instances are needed
+        self.instances = OrderedDict()
+        # model -> the columns to load them with, or None for all of them
+        self.columns = {}
+        # model -> pks that only need to exist
+        self.existence = OrderedDict()
+
+    def add(self, ModelClass, pks, columns=None):
+        self.instances.setdefault(ModelClass, set()).update(pks)
+        if ModelClass not in self.columns:
+            self.columns[ModelClass] = columns
+        elif columns is None or self.columns[ModelClass] is None:
+            self.columns[ModelClass] = None
+        else:
+            self.columns[ModelClass] = tuple(sorted(set(self.columns[ModelClass]) | set(columns)))
+
+    def add_existence(self, ModelClass, pks):
+        self.existence.setdefault(ModelClass, set()).update(pks)
+
+    def models(self):
+        return list(OrderedDict.fromkeys(list(self.instances) + list(self.existence)))
+
+
+# the methods that decide what fields a serializer builds, which a subclass overriding might base on its context
+FIELD_BUILDING_METHODS = ("get_fields", "get_extra_kwargs", "build_field")
+
+# what a field works out for itself once it's bound or used, which a copy of it mustn't share
+BOUND_FIELD_ATTRS = (
+    "parent", "field_name", "source_attrs", "root", "context", "_fields", "_readable_fields", "_writable_fields"
+)
+
+
+def copy_field(field):
+    """A cheap copy of an unbound field, for `NestedModelSerializer.get_field_template()`. Rather than constructing
+    it all over again (which is what deepcopying a field does), it gets its own copy of the field's attributes (and of
+    its validators and error messages, which are commonly changed in place), and list and many-related fields get
+    copies of their child.
+    """
+    copied = copy.copy(field)
+    for attr in BOUND_FIELD_ATTRS:
+        copied.__dict__.pop(attr, None)
+    copied.error_messages = copy.deepcopy(field.error_messages)
+    if "_validators" in field.__dict__:
+        copied._validators = copy.deepcopy(field._validators)
+    # binding fills in the source if it wasn't given
+    copied.source = field._kwargs.get("source")
+
+    for attr in ("child", "child_relation"):
+        child = copied.__dict__.get(attr)
+        if child is not None:
+            child = copy_field(child)
+            setattr(copied, attr, child)
+            child.bind(field_name="", parent=copied)
+    return copied
+
+
+def get_compiled_values(instance, source):
+    return getattr(instance, COMPILED_VALUES_ATTR, {}).get(source)
+
+
+def get_cached_representations(instance, source, default=None):
+    return getattr(instance, CACHED_REPRESENTATIONS_ATTR, {}).get(source, default)
+
 
 class NestedListSerializer(serializers.ListSerializer):
+    # how many objects get loaded (and prefetched for) at a time by iter_representation
+    stream_chunk_size = 500
+
+    def __init__(self, *args, **kwargs):
+        """Takes what to do with the children of a reverse FK that an update leaves out of the list, as `orphans`:
+        ORPHANS_KEEP them, ORPHANS_DELETE them or ORPHANS_NULL out their FK. By default they're nulled out if the FK
+        is nullable, and kept if it isn't.
+        """
+        self.orphans = kwargs.pop("orphans", None)
+        assert self.orphans in (None, ORPHANS_KEEP, ORPHANS_DELETE, ORPHANS_NULL), (
+            "orphans must be one of {!r}, {!r} or {!r}.".format(ORPHANS_KEEP, ORPHANS_DELETE, ORPHANS_NULL)
+        )
+        super(NestedListSerializer, self).__init__(*args, **kwargs)
+
+    def bind(self, field_name, parent):
+        super(NestedListSerializer, self).bind(field_name, parent)
+        if self.orphans == ORPHANS_NULL:
+            fk, parent_pk = self.get_parent_link()
+            assert fk is None or fk.null, (
+                "{}.{} can't null out its orphans, since {} isn't nullable.".format(
+                    parent.__class__.__name__, field_name, fk.name
+                )
+            )
+
+    def to_internal_value(self, data):
+        if self.parent is None and isinstance(data, list):
+            # a batch of top-level objects, so load everything they refer to before validating any of them
+            self.child.resolve_references(data)
+
+        if self.parent is not None and isinstance(data, list) and self.child.links_by_pk():
+            return self.pk_references(data)
+
+        # if the child knows how to resolve its references in bulk, let it do so up front
+        # rather than having every item hit the db on its own
+        prefetch = getattr(self.child, "prefetch_instances", None)
+        if prefetch is None or not isinstance(data, list):
+            ret = super(NestedListSerializer, self).to_internal_value(data)
+        else:
+            prefetch(data)
+            try:
+                ret = super(NestedListSerializer, self).to_internal_value(data)
+            finally:
+                self.child.clear_prefetched_instances()
+
+        self.validate_unique_together(ret)
+        return ret
+
+    def validate_unique_together(self, items):
+        """Checks the items against their model's unique_together, which is what UniqueTogetherValidator would do if
+        it didn't cost a query per item. Duplicates within the list are found in memory, and then whatever is new or
+        changing is checked against the db with one query (per unique_together).
+        """
+        opts = self.child.Meta.model._meta
+        if not items or not opts.unique_together:
+            return
+
+        parent_fk, parent_pk = self.get_parent_link()
+        pk_name = self.child.get_write_plan().pk_name
+        instances = self.child.get_instances([
+            item[pk_name] for item in items if isinstance(item, dict) and item.get(pk_name, empty) not in (empty, None)
+        ])
+        errors = [{} for item in items]
+
+        for names in opts.unique_together:
+            model_fields = [opts.get_field(name) for name in names]
+            message = "The fields {} must make a unique set.".format(", ".join(names))
+            seen = {}
+            candidates = {}
+            for index, item in enumerate(items):
+                if isinstance(item, models.Model):
+                    instance = item
+                elif isinstance(item, dict):
+                    instance = instances.get(self.child.to_pk(item.get(pk_name)))
+                else:
+                    continue
+
+                values = []
+                for model_field in model_fields:
+                    if model_field is parent_fk:
+                        # it's about to be pointed at the parent, which we might not know (or have) the pk of
+                        value = parent_pk
+                    elif isinstance(item, dict) and model_field.name in item:
+                        value = getattr(item[model_field.name], "pk", item[model_field.name])
+                    elif instance is not None:
+                        value = getattr(instance, model_field.attname)
+                    else:
+                        # we'll have to leave this one up to the db
+                        break
+                    values.append(value)
+                else:
+                    values = tuple(values)
+                    pk = getattr(instance, "pk", None)
+                    if values in seen and (pk is None or seen[values] != pk):
+                        errors[index] = {api_settings.NON_FIELD_ERRORS_KEY: [message]}
+                        continue
+                    seen[values] = pk
+
+                    changed = instance is None or any(
+                        value != getattr(instance, model_field.attname) for value, model_field in zip(values, model_fields)
+                    )
+                    if changed and parent_pk is not empty:
+                        candidates.setdefault(values, []).append(index)
+
+            if not candidates:
+                continue
+
+            condition = models.Q()
+            for values in candidates:
+                condition |= models.Q(**dict(
+                    (model_field.attname, value) for model_field, value in zip(model_fields, values)
+                ))
+            queryset = self.child.Meta.model._default_manager.filter(condition).exclude(
+                pk__in=[instance.pk for instance in instances.values()] +
+                [item.pk for item in items if isinstance(item, models.Model)]
+            )
+            if parent_fk is not None and self.orphans in (ORPHANS_DELETE, ORPHANS_NULL):
+                # whatever the parent has now that isn't in the list is on its way out
+                queryset = queryset.exclude(**{parent_fk.attname: parent_pk})
+
+            for values in queryset.values_list(*[model_field.attname for model_field in model_fields]):
+                for index in candidates.get(tuple(values), []):
+                    errors[index] = {api_settings.NON_FIELD_ERRORS_KEY: [message]}
+
+        if any(errors):
+            raise ValidationError(errors)
+
+    def get_parent_link(self):
+        """Returns the FK that points this (reverse FK) list's children at their parent, along with the parent's pk,
+        or `empty` if that isn't known yet
+        """
+        if not isinstance(self.parent, NestedModelSerializer):
+            return None, None
+
+        model_field, reverse = get_relation_field(self.parent.Meta.model, self.source)
+        if not reverse or model_field.many_to_many:
+            return None, None
+
+        parent_instance = self.parent.instance
+        if isinstance(parent_instance, models.Model) and parent_instance.pk is not None:
+            return model_field, parent_instance.pk
+        return model_field, empty
+
+    def pk_references(self, data):
+        """Validates a list of `{"id": ...}` references by checking that the ids exist, all with one
+        `values_list("pk")` query. Linking only needs the pks, so unless the identity map already has the instance,
+        what comes back is a stand-in that carries nothing but its pk.
+        """
+        ModelClass = self.child.Meta.model
+        pks = [self.child.to_pk(item.get("id")) if isinstance(item, dict) else None for item in data]
+        existing = self.child.get_existing_pks([pk for pk in pks if pk is not None])
+        identity_map = self.child.identity_map
+
+        ret = []
+        errors = []
+        for pk in pks:
+            if pk not in existing:
+                errors.append(["{} matching query does not exist.".format(ModelClass._meta.object_name)])
+                continue
+
+            instance = identity_map.get((ModelClass, pk))
+            if instance is None:
+                instance = ModelClass(pk=pk)
+                instance._state.adding = False
+            ret.append(instance)
+            errors.append({})
+
+        if any(errors):
+            raise ValidationError(errors)
+        return ret
+
+    def iter_representation(self, data, chunk_size=None):
+        """Does what to_representation does, but yields the items one at a time (loading querysets a chunk at a
+        time) rather than building the whole list in memory.
+        """
+        iterable = data.all() if isinstance(data, models.Manager) else data
+        for chunk in iter_chunks(iterable, chunk_size or self.stream_chunk_size):
+            self.child.load_compiled_values(chunk)
+            for item in chunk:
+                yield self.child.to_representation(item)
+
+    @instrumented("to_representation")
+    def to_representation(self, data):
+        parent_instance = getattr(data, "instance", None) if isinstance(data, models.Manager) else None
+        if parent_instance is not None and self.child.uses_representation_cache():
+            representations = get_cached_representations(parent_instance, self.source)
+            if representations is None and isinstance(self.parent, NestedModelSerializer):
+                self.parent.load_compiled_values([parent_instance])
+                representations = get_cached_representations(parent_instance, self.source)
+            if representations is not None:
+                return list(representations)
+
+        if parent_instance is not None and self.child.get_compiled_columns() is not None:
+            # reference-only children come straight out of the rows the parent loaded for them
+            rows = get_compiled_values(parent_instance, self.source)
+            if rows is None and isinstance(self.parent, NestedModelSerializer):
+                self.parent.load_compiled_values([parent_instance])
+                rows = get_compiled_values(parent_instance, self.source)
+            if rows is not None:
+                return [OrderedDict(row) for row in rows]
+
+        iterable = data.all() if isinstance(data, models.Manager) else data
+        items = list(iterable)
+        self.child.load_compiled_values(items)
+        return [self.child.to_representation(item) for item in items]
+
+    @instrumented("create")
+    @deferred_writes
     def create(self, validated_data):
+        if self.parent is None:
+            # we're not nested, so this is a batch of new top-level objects
+            return self.create_batch(validated_data)
+
         return_instances = []
 
+        # warm the identity map with everything we're about to need
+        self.child.get_instances([
+            child_data["id"] for child_data in validated_data
+            if isinstance(child_data, dict) and child_data.get("id", empty) is not empty
+        ])
+
         for child_data in validated_data:
-            if child_data.get("id", empty) is empty:
+            if isinstance(child_data, models.Model):
+                # this is an actual object, so add it to the return instances
+                return_instances.append(child_data)
+
+            elif child_data.get("id", empty) is empty:
                 # we don't want to descend into creating objects, so throw a validation error
                 # here and inform the user to create the related object before saving the
                 # instance in operation
@@ -21,15 +530,23 @@ class NestedListSerializer(serializers.ListSerializer):
 
             else:
                 # We have an id, so let's grab this sumbitch
-                ModelClass = self.child.Meta.model
-                child_instance = ModelClass.objects.get(pk=child_data["id"])
+                child_instance = self.child.get_instance(child_data["id"])
                 return_instances.append(self.child.update(child_instance, child_data))
 
         return return_instances
 
+    @instrumented("update")
+    @deferred_writes
     def update(self, instance, validated_data):
+        if self.parent is None:
+            # we're not nested, so this is a batch of top-level objects
+            return self.update_batch(instance, validated_data)
+
         # instance is a qs...
-        current_objects = {obj.id: obj for obj in instance}
+        current_objects = {obj.pk: obj for obj in instance}
+        if self.child.supports_bulk_writes():
+            return self.bulk_update(current_objects, validated_data)
+
         return_instances = []
 
         for child_data in validated_data:
@@ -44,7 +561,7 @@ class NestedListSerializer(serializers.ListSerializer):
 
                 else:
                     # We have an id, so let's grab this sumbitch
-                    child_instance = current_objects.pop(child_data["id"])
+                    child_instance = self.get_child_instance(current_objects, child_data["id"])
                     return_instances.append(self.child.update(child_instance, child_data))
 
             except AttributeError:
@@ -53,24 +570,708 @@ class NestedListSerializer(serializers.ListSerializer):
 
         return return_instances
 
+    def get_child_instance(self, current_objects, pk):
+        """Pops the child with this id off the current ones. An id that isn't one of them has been checked to exist,
+        and is in the identity map, so it's moved over to the parent.
+        """
+        pk = self.child.to_pk(pk)
+        child_instance = current_objects.pop(pk, None)
+        if child_instance is None:
+            child_instance = self.child.get_instance(pk)
+        return child_instance
+
+    def create_batch(self, validated_data):
+        """Creates a batch of top-level objects, then links them up with all of their m2m rows inserted together. A
+        child that overrides `create()` gets it called for each object instead, like ListSerializer does.
+        """
+        if six.get_unbound_function(self.child.__class__.create) is not \
+                six.get_unbound_function(NestedModelSerializer.create):
+            return [self.child.create(child_data) for child_data in validated_data]
+
+        ModelClass = self.child.Meta.model
+        pk_name = self.child.get_write_plan().pk_name
+        instances = []
+        related = []
+
+        for child_data in validated_data:
+            child_data = dict(child_data)
+            child_data.pop(pk_name, None)
+            related.append(self.child.pop_nested_writes(child_data))
+            instances.append(ModelClass(**child_data))
+
+        self.bulk_create_instances(instances)
+        self.link_batch(instances, related)
+        return instances
+
+    def link_batch(self, instances, related):
+        """Sets the to-many relationships of a batch of freshly created objects"""
+        for write_field in self.child.get_write_plan().fields:
+            if write_field.kind not in (M2M, REVERSE_FK):
+                continue
+
+            for instance, related_instances in zip(instances, related):
+                if write_field.source in related_instances:
+                    self.child.update_m2m(instance, write_field, (), related_instances[write_field.source])
+
+    def update_batch(self, instance, validated_data):
+        """Updates a batch of top-level objects (creating any without an id), with their current to-many
+        relationships loaded all at once.
+        """
+        plan = self.child.get_write_plan()
+        instances = list(instance)
+        current_objects = dict((obj.pk, obj) for obj in instances)
+
+        # make sure every id is in the batch before we write anything
+        errors = []
+        for child_data in validated_data:
+            pk = child_data.get(plan.pk_name, empty)
+            if pk is empty or pk is None or self.child.to_pk(pk) in current_objects:
+                errors.append({})
+            else:
+                errors.append({plan.pk_name: ["No object with this id is part of the batch."]})
+        if any(errors):
+            raise ValidationError(errors)
+
+        lookups = [
+            write_field.source for write_field in plan.fields
+            if write_field.kind in (M2M, REVERSE_FK) and
+            any(write_field.source in child_data for child_data in validated_data)
+        ]
+        if lookups and instances:
+            prefetch_related_objects(instances, lookups)
+
+        return_instances = []
+        new_data = []
+        for child_data in validated_data:
+            pk = child_data.get(plan.pk_name, empty)
+            if pk is empty or pk is None:
+                new_data.append(child_data)
+                return_instances.append(None)
+            else:
+                child_instance = self.child.update(current_objects[self.child.to_pk(pk)], child_data)
+                # what we prefetched is stale now
+                child_instance._prefetched_objects_cache = {}
+                return_instances.append(child_instance)
+
+        created = iter(self.create_batch(new_data))
+        return [next(created) if child_instance is None else child_instance for child_instance in return_instances]
+
+    def bulk_update(self, current_objects, validated_data):
+        """Does the same thing as `update`, but with one UPDATE (of only the changed columns) for the existing
+        children. The new ones are inserted in the same transaction, see `bulk_create_instances`.
+        """
+        ModelClass = self.child.Meta.model
+        opts = ModelClass._meta
+        return_instances = []
+        created = []
+        changed = []
+        changed_fields = set()
+
+        for child_data in validated_data:
+            if isinstance(child_data, models.Model):
+                # this is an actual object, so add it to the return instances
+                return_instances.append(child_data)
+                continue
+
+            child_data = dict(child_data)
+            pk = child_data.pop("id", empty)
+            if pk is empty or pk is None:
+                child_instance = ModelClass(**child_data)
+                created.append(child_instance)
+
+            else:
+                child_instance = self.get_child_instance(current_objects, pk)
+                dirty = False
+                for attr, value in child_data.items():
+                    model_field = opts.get_field(attr)
+                    if model_field.is_relation:
+                        # compare the raw column, so we don't go fetching the related object
+                        current, new = getattr(child_instance, model_field.attname), getattr(value, "pk", value)
+                    else:
+                        current, new = getattr(child_instance, attr), value
+                    if current != new:
+                        setattr(child_instance, attr, value)
+                        changed_fields.add(model_field)
+                        dirty = True
+                if dirty:
+                    changed.append(child_instance)
+
+            return_instances.append(child_instance)
+
+        self.bulk_create_instances(created)
+        self.bulk_update_instances(changed, changed_fields)
+        return return_instances
+
+    def bulk_create_instances(self, instances):
+        """Inserts the new instances one at a time, in a single transaction. They need their pks to be linked up
+        afterwards, and Django 1.8's `bulk_create` doesn't set them on any backend.
+        """
+        if not instances:
+            return
+
+        ModelClass = self.child.Meta.model
+        db = router.db_for_write(ModelClass)
+        with transaction.atomic(using=db, savepoint=False):
+            for child_instance in instances:
+                child_instance.save(force_insert=True, using=db)
+
+    def bulk_update_instances(self, instances, model_fields):
+        """Writes every changed column of every instance in a single UPDATE ... SET col = CASE ..."""
+        if not instances:
+            return
+
+        # save_changes saves the auto_now fields along with any change, so these have to as well
+        model_fields = list(model_fields)
+        write_plan = self.child.get_write_plan()
+        for name in write_plan.auto_now_fields:
+            model_field = write_plan.columns[name]
+            if model_field not in model_fields:
+                for child_instance in instances:
+                    model_field.pre_save(child_instance, False)
+                model_fields.append(model_field)
+
+        updates = {}
+        for model_field in model_fields:
+            whens = [
+                When(pk=child_instance.pk, then=Value(getattr(child_instance, model_field.attname), output_field=model_field))
+                for child_instance in instances
+            ]
+            updates[model_field.attname] = Case(*whens, default=F(model_field.attname), output_field=model_field)
+
+        ModelClass = self.child.Meta.model
+        pks = [child_instance.pk for child_instance in instances]
+        ModelClass._default_manager.filter(pk__in=pks).update(**updates)
+        # updates don't send post_save
+        invalidate(ModelClass, pks)
+
+
+class NestedSerializerMetaclass(serializers.SerializerMetaclass):
+    def __new__(cls, name, bases, attrs):
+        serializer_class = super(NestedSerializerMetaclass, cls).__new__(cls, name, bases, attrs)
+        register(serializer_class)
+        return serializer_class
+
+
+class NestedModelSerializer(six.with_metaclass(NestedSerializerMetaclass, serializers.ModelSerializer)):
+    serializer_related_field = NestedPrimaryKeyRelatedField
+    list_serializer_class = NestedListSerializer
+
+    def __init__(self, *args, **kwargs):
+        """Takes a sparse fieldset as `fields` and/or `omit` (e.g. "id,title,feature_type.name"). Without either,
+        a top-level serializer looks for `?fields=` and `?omit=` on the request.
+        """
+        fields = kwargs.pop("fields", None)
+        omit = kwargs.pop("omit", None)
+        super(NestedModelSerializer, self).__init__(*args, **kwargs)
+        self._sparse_fieldset = empty
+        if fields is not None or omit is not None:
+            self._sparse_fieldset = (
+                parse_fieldset(fields) if fields is not None else None,
+                parse_fieldset(omit) if omit is not None else None,
+            )
 
-class NestedModelSerializer(serializers.ModelSerializer):
     @classmethod
     def many_init(cls, *args, **kwargs):
-        kwargs['child'] = cls()
-        return NestedListSerializer(*args, **kwargs)
+        kwargs['child'] = cls(fields=kwargs.pop("fields", None), omit=kwargs.pop("omit", None))
+        return cls.list_serializer_class(*args, **kwargs)
+
+    @property
+    def sparse_fieldset(self):
+        """The (include, omit) trees of field names this serializer is limited to, or None if it isn't. `?fields=`
+        and `?omit=` only apply to reads, since leaving fields out of a write would drop what was submitted for them.
+        """
+        if self._sparse_fieldset is empty:
+            self._sparse_fieldset = None
+            parent = self.parent
+            if parent is None or (isinstance(parent, serializers.ListSerializer) and parent.parent is None):
+                # not `self.context`, which would be stuck with the wrong root if we haven't been bound yet
+                root = parent or self
+                request = getattr(root, "_context", {}).get("request")
+                params = {}
+                if getattr(request, "method", None) in SAFE_METHODS:
+                    params = getattr(request, "query_params", getattr(request, "GET", {}))
+                fields, omit = params.get("fields"), params.get("omit")
+                if fields or omit:
+                    self._sparse_fieldset = (
+                        parse_fieldset(fields) if fields else None,
+                        parse_fieldset(omit) if omit else None,
+                    )
+        return self._sparse_fieldset
+
+    def is_selected(self, field_name):
+        include, omit = self.sparse_fieldset
+        if include is not None and field_name not in include:
+            return False
+        return omit is None or field_name not in omit or omit[field_name] is not None
+
+    @classmethod
+    def get_field_template(cls):
+        """Returns the unbound fields of this serializer, which are worked out once per class. Every instance gets
+        copies of them from `get_fields()`, rather than building the ModelSerializer field mapping all over again.
+        """
+        if cls not in _field_templates:
+            _field_templates[cls] = cls().build_fields()
+        return _field_templates[cls]
+
+    @classmethod
+    def uses_field_template(cls):
+        """Whether the field template is good for every instance. A subclass that overrides how its fields are built
+        might depend on its context (or anything else about the instance), so it builds them every time instead.
+        """
+        return all(
+            six.get_unbound_function(getattr(cls, name)) is six.get_unbound_function(getattr(NestedModelSerializer, name))
+            for name in FIELD_BUILDING_METHODS
+        )
+
+    def build_fields(self):
+        return super(NestedModelSerializer, self).get_fields()
+
+    def get_fields(self):
+        """Copies the field template, leaving out anything the sparse fieldset doesn't want, and hands nested
+        serializers their part of the fieldset.
+        """
+        if self.uses_field_template():
+            fields = OrderedDict(
+                (name, copy_field(field)) for name, field in self.get_field_template().items()
+                if self.sparse_fieldset is None or self.is_selected(name)
+            )
+        else:
+            fields = OrderedDict(
+                (name, field) for name, field in self.build_fields().items()
+                if self.sparse_fieldset is None or self.is_selected(name)
+            )
+        if self.sparse_fieldset is None:
+            return fields
+
+        include, omit = self.sparse_fieldset
+        for name, field in fields.items():
+            child = getattr(field, "child", field)
+            if isinstance(child, NestedModelSerializer):
+                sparse_fieldset = (include and include.get(name), omit and omit.get(name))
+                child._sparse_fieldset = sparse_fieldset if sparse_fieldset != (None, None) else None
+                if hasattr(child, "_fields"):
+                    # built already (by something wanting its validators, say), so build them again
+                    del child._fields
+        return fields
+
+    def get_compiled_columns(self):
+        """`get_compiled_read()`, less anything the sparse fieldset left out"""
+        compiled_read = self.get_compiled_read()
+        if compiled_read is None or self.sparse_fieldset is None:
+            return compiled_read
+        return tuple((name, column) for name, column in compiled_read if name in self.fields)
+
+    def uses_representation_cache(self):
+        """Whether this serializer's representations come out of the cache (`Meta.cache_representation = True`).
+        A sparse fieldset renders something different, so it always renders from scratch.
+        """
+        meta = getattr(self, "Meta", None)
+        return getattr(meta, "cache_representation", False) and self.sparse_fieldset is None
+
+    def get_representations(self, pks):
+        """Returns {pk: representation}, from the cache where possible. The rest are loaded with one query, rendered
+        and cached.
+        """
+        ModelClass = self.Meta.model
+        cache = get_cache()
+        keys = dict((get_cache_key(self.__class__, ModelClass, pk), pk) for pk in pks)
+        representations = dict((keys[key], value) for key, value in cache.get_many(list(keys)).items())
+
+        missing = [pk for pk in keys.values() if pk not in representations]
+        if missing:
+            instances = list(self.optimize_queryset(ModelClass._default_manager.filter(pk__in=missing)))
+            self.load_compiled_values(instances)
+            rendered = dict((instance.pk, self.to_representation(instance)) for instance in instances)
+            cache.set_many(
+                dict((get_cache_key(self.__class__, ModelClass, pk), value) for pk, value in rendered.items()),
+                getattr(self.Meta, "cache_timeout", DEFAULT_TIMEOUT)
+            )
+            representations.update(rendered)
+        return representations
+
+    @instrumented("get_attribute")
+    def get_attribute(self, instance):
+        # a nested FK whose representation is cached doesn't need the related instance at all
+        if self.uses_representation_cache() and isinstance(self.parent, NestedModelSerializer) and \
+                isinstance(instance, models.Model):
+            representation = get_cached_representations(instance, self.source, empty)
+            if representation is empty:
+                self.parent.load_compiled_values([instance])
+                representation = get_cached_representations(instance, self.source, empty)
+            if representation is not empty:
+                return None if representation is None else CachedRepresentation(representation)
+        return super(NestedModelSerializer, self).get_attribute(instance)
+
+    @instrumented("to_representation")
+    def to_representation(self, instance):
+        if isinstance(instance, CachedRepresentation):
+            return instance.representation
+        return super(NestedModelSerializer, self).to_representation(instance)
+
+    @property
+    def identity_map(self):
+        """A cache of model instances keyed by (model, pk), shared by every serializer in the tree
+        for as long as the root serializer's context lives (i.e. a single request).
+        """
+        return self.context.setdefault(IDENTITY_MAP_CONTEXT_KEY, {})
+
+    @property
+    def missing_pks(self):
+        """The (model, pk) pairs that have been looked for and don't exist, so they aren't looked for again"""
+        return self.context.setdefault(MISSING_PKS_CONTEXT_KEY, set())
+
+    def to_pk(self, value, ModelClass=None):
+        """Coerces a submitted id to the python type of the model's pk, or None if it can't be"""
+        ModelClass = ModelClass or self.Meta.model
+        try:
+            return ModelClass._meta.pk.to_python(value)
+        except (DjangoValidationError, TypeError, ValueError):
+            return None
+
+    def get_instance(self, pk, ModelClass=None):
+        """Returns the instance for `pk`, loading it at most once per request"""
+        ModelClass = ModelClass or self.Meta.model
+        pk = self.to_pk(pk, ModelClass)
+        if pk is None:
+            raise ModelClass.DoesNotExist("{} matching query does not exist.".format(ModelClass._meta.object_name))
+
+        key = (ModelClass, pk)
+        identity_map = self.identity_map
+        if key not in identity_map:
+            missing = self.missing_pks
+            if key in missing:
+                raise ModelClass.DoesNotExist("{} matching query does not exist.".format(ModelClass._meta.object_name))
+            try:
+                identity_map[key] = self.get_lookup_queryset(ModelClass).get(pk=pk)
+            except ModelClass.DoesNotExist:
+                missing.add(key)
+                raise
+        return identity_map[key]
+
+    def get_instances(self, pks, ModelClass=None):
+        """Returns {pk: instance} for every pk that exists, only querying for the ones we haven't seen"""
+        ModelClass = ModelClass or self.Meta.model
+        identity_map = self.identity_map
+
+        pks = set(pk for pk in (self.to_pk(value, ModelClass) for value in pks) if pk is not None)
+        missing_pks = self.missing_pks
+        missing = [pk for pk in pks if (ModelClass, pk) not in identity_map and (ModelClass, pk) not in missing_pks]
+        if missing:
+            for pk, obj in self.get_lookup_queryset(ModelClass).in_bulk(missing).items():
+                identity_map[(ModelClass, pk)] = obj
+            missing_pks.update((ModelClass, pk) for pk in missing if (ModelClass, pk) not in identity_map)
+
+        return dict(
+            (pk, identity_map[(ModelClass, pk)]) for pk in pks if (ModelClass, pk) in identity_map
+        )
+
+    def get_lookup_queryset(self, ModelClass=None):
+        """The queryset instances get looked up from, which only loads the columns this serializer uses"""
+        ModelClass = ModelClass or self.Meta.model
+        queryset = ModelClass.objects.all()
+        if ModelClass is self.Meta.model and self.get_lookup_columns():
+            queryset = queryset.only(*self.get_lookup_columns())
+        return queryset
+
+    @classmethod
+    def get_lookup_columns(cls):
+        """Returns the names of the model fields this serializer reads or writes (pk included), or None if it might
+        need any of them. It's worked out once per class.
+        """
+        if "_lookup_columns" not in cls.__dict__:
+            cls._lookup_columns = cls().build_lookup_columns()
+        return cls._lookup_columns
+
+    def build_lookup_columns(self):
+        opts = self.Meta.model._meta
+        columns = set([opts.pk.name])
+        for field in self.fields.values():
+            if field.source == "*" or "." in field.source:
+                return None
+            try:
+                model_field = opts.get_field(field.source)
+            except FieldDoesNotExist:
+                if get_relation_field(self.Meta.model, field.source)[1]:
+                    # a reverse relation going by its accessor name, which doesn't need any of our columns
+                    continue
+                # a property or method, which could be using any column at all
+                return None
+            if model_field.concrete and not model_field.many_to_many:
+                columns.add(model_field.name)
+
+        if len(columns) == len(opts.concrete_fields):
+            # nothing to leave out
+            return None
+        return tuple(sorted(columns))
+
+    def get_current_pk(self):
+        """The pk this (FK) field's parent points at now, if the parent is being partially updated, so that
+        submitting it again can be skipped. Otherwise `empty`.
+        """
+        parent = self.parent
+        if not isinstance(parent, NestedModelSerializer) or not isinstance(parent.instance, models.Model) or \
+                not getattr(self.root, "partial", False):
+            return empty
+
+        model_field = parent.get_write_plan().columns.get(self.source)
+        if model_field is None or not model_field.is_relation:
+            return empty
+        return getattr(parent.instance, model_field.attname)
+
+    def get_existing_pks(self, pks, ModelClass=None):
+        """Returns the set of pks that exist, checking the ones we haven't seen with a single `values_list("pk")`"""
+        ModelClass = ModelClass or self.Meta.model
+        identity_map = self.identity_map
+        known = self.context.setdefault(EXISTING_PKS_CONTEXT_KEY, set())
+
+        missing_pks = self.missing_pks
+
+        pks = set(pks)
+        missing = [
+            pk for pk in pks
+            if (ModelClass, pk) not in known and (ModelClass, pk) not in identity_map and (ModelClass, pk) not in missing_pks
+        ]
+        if missing:
+            for pk in ModelClass.objects.filter(pk__in=missing).values_list("pk", flat=True):
+                known.add((ModelClass, pk))
+            missing_pks.update((ModelClass, pk) for pk in missing if (ModelClass, pk) not in known)
+
+        return set(pk for pk in pks if (ModelClass, pk) in known or (ModelClass, pk) in identity_map)
+
+    @classmethod
+    def links_by_pk(cls):
+        """Whether nested lists of this serializer are only links (`Meta.link_by_pk = True`). Their items are checked
+        for existence and linked by pk, without loading or writing the related rows; anything but the id is ignored.
+        """
+        return getattr(getattr(cls, "Meta", None), "link_by_pk", False)
+
+    @classmethod
+    def get_query_plan(cls):
+        """Returns the select_related/prefetch_related plan needed to represent this serializer
+        without any per-row queries. It's worked out once per class.
+        """
+        if "_query_plan" not in cls.__dict__:
+            cls._query_plan = cls().build_query_plan()
+        return cls._query_plan
+
+    @classmethod
+    def optimize_queryset(cls, queryset):
+        return apply_query_plan(queryset, cls.get_query_plan())
+
+    def supports_bulk_writes(self):
+        """Children can be written in bulk if they ask for it (`Meta.bulk_writes = True`), and have no
+        nested writes of their own.
+        """
+        if not getattr(getattr(self, "Meta", None), "bulk_writes", False):
+            return False
+
+        for field in self._writable_fields:
+            if isinstance(field, (serializers.BaseSerializer, serializers.ManyRelatedField)):
+                return False
+        return True
+
+    @classmethod
+    def get_compiled_read(cls):
+        """Returns the (field name, column) pairs this serializer can be represented with, if it has asked for a
+        compiled read (`Meta.compiled_read = True`) and only has simple model fields. Nested lists of such serializers
+        are loaded with `values_list()` and rendered straight into dicts, without building any model instances.
+        """
+        if "_compiled_read" not in cls.__dict__:
+            cls._compiled_read = None
+            if getattr(getattr(cls, "Meta", None), "compiled_read", False):
+                cls._compiled_read = cls().build_compiled_read()
+        return cls._compiled_read
+
+    def build_compiled_read(self):
+        opts = self.Meta.model._meta
+        columns = []
+        for field in self._readable_fields:
+            if type(field) not in COMPILED_READ_FIELDS or field.source == "*" or "." in field.source:
+                return None
+            try:
+                model_field = opts.get_field(field.source)
+            except FieldDoesNotExist:
+                return None
+            if not model_field.concrete or model_field.many_to_many:
+                return None
+            columns.append((field.field_name, field.source))
+        return tuple(columns)
+
+    def load_compiled_values(self, instances):
+        """Loads the rows for every compiled nested list on these instances, with one query per list. Lists that
+        were prefetched get descended into, so their own compiled lists are loaded in one go as well, and compiled
+        lists that were prefetched (by the view, say, perhaps with a filtered `Prefetch`) are read off the prefetched
+        objects instead. Cached nested fields get their representations fetched for all of the instances at once.
+        """
+        if not instances:
+            return
+
+        ModelClass = self.Meta.model
+        for field in self._readable_fields:
+            if field.source == "*" or "." in field.source:
+                continue
+
+            if isinstance(field, NestedModelSerializer) and field.uses_representation_cache():
+                self.load_cached_representations(instances, field)
+                continue
+
+            child = getattr(field, "child", None)
+            if not isinstance(child, NestedModelSerializer):
+                continue
+
+            if child.uses_representation_cache():
+                self.load_cached_representations(instances, field)
+                continue
+
+            compiled_read = child.get_compiled_columns()
+            if compiled_read is None:
+                prefetch_cache_name = get_prefetch_cache_name(*get_relation_field(ModelClass, field.source))
+                children = []
+                for instance in instances:
+                    if prefetch_cache_name not in getattr(instance, "_prefetched_objects_cache", {}):
+                        break
+                    children.extend(getattr(instance, field.source).all())
+                else:
+                    child.load_compiled_values(children)
+                continue
+
+            pending = dict(
+                (instance.pk, instance) for instance in instances if get_compiled_values(instance, field.source) is None
+            )
+            if not pending:
+                continue
+
+            model_field, reverse = get_relation_field(ModelClass, field.source)
+            prefetch_cache_name = get_prefetch_cache_name(model_field, reverse)
+            related_opts = child.Meta.model._meta
+            attnames = [(name, related_opts.get_field(column).attname) for name, column in compiled_read]
+            for pk, instance in list(pending.items()):
+                if prefetch_cache_name in getattr(instance, "_prefetched_objects_cache", {}):
+                    instance.__dict__.setdefault(COMPILED_VALUES_ATTR, {})[field.source] = [
+                        tuple((name, getattr(obj, attname)) for name, attname in attnames)
+                        for obj in getattr(instance, field.source).all()
+                    ]
+                    del pending[pk]
+            if not pending:
+                continue
+
+            if reverse:
+                # a reverse FK (or m2m)
+                RelatedClass, query_name = model_field.model, model_field.name
+            else:
+                # a forward m2m
+                RelatedClass, query_name = model_field.related_model, model_field.related_query_name()
+
+            rows = dict((pk, []) for pk in pending)
+            names = [name for name, column in compiled_read]
+            values = RelatedClass._default_manager.filter(**{query_name + "__in": list(pending)})
+            for row in values.values_list(query_name, *[column for name, column in compiled_read]):
+                rows[row[0]].append(tuple(zip(names, row[1:])))
+
+            for pk, instance in pending.items():
+                instance.__dict__.setdefault(COMPILED_VALUES_ATTR, {})[field.source] = rows[pk]
+
+    def load_cached_representations(self, instances, field):
+        """Stashes the representations of a cached nested field (or list) on each of the instances. Only the related
+        pks get loaded from the db (and for a nested FK, not even those), unless a list was prefetched already, in
+        which case it's the prefetched objects that get represented.
+        """
+        pending = [
+            instance for instance in instances
+            if get_cached_representations(instance, field.source, empty) is empty
+        ]
+        if not pending:
+            return
+
+        model_field, reverse = get_relation_field(self.Meta.model, field.source)
+        if isinstance(field, NestedModelSerializer):
+            if reverse:
+                # a reverse one-to-one, which doesn't have a column to go on
+                return
+            pks = dict((instance, getattr(instance, model_field.attname)) for instance in pending)
+            representations = field.get_representations(set(pk for pk in pks.values() if pk is not None))
+            for instance, pk in pks.items():
+                instance.__dict__.setdefault(CACHED_REPRESENTATIONS_ATTR, {})[field.source] = representations.get(pk)
+            return
+
+        if reverse:
+            # a reverse FK (or m2m)
+            RelatedClass, query_name = model_field.model, model_field.name
+        else:
+            # a forward m2m
+            RelatedClass, query_name = model_field.related_model, model_field.related_query_name()
+
+        prefetch_cache_name = get_prefetch_cache_name(model_field, reverse)
+        related_pks = {}
+        for instance in pending:
+            if prefetch_cache_name in getattr(instance, "_prefetched_objects_cache", {}):
+                related_pks[instance.pk] = [obj.pk for obj in getattr(instance, field.source).all()]
+        unloaded = [instance.pk for instance in pending if instance.pk not in related_pks]
+        if unloaded:
+            related_pks.update((pk, []) for pk in unloaded)
+            values = RelatedClass._default_manager.filter(**{query_name + "__in": unloaded})
+            for pk, related_pk in values.values_list(query_name, "pk"):
+                related_pks[pk].append(related_pk)
+
+        representations = field.child.get_representations(set(pk for pks in related_pks.values() for pk in pks))
+        for instance in pending:
+            instance.__dict__.setdefault(CACHED_REPRESENTATIONS_ATTR, {})[field.source] = [
+                representations[pk] for pk in related_pks[instance.pk] if pk in representations
+            ]
+
+    def build_query_plan(self):
+        """Walks the (readable) fields of this serializer, and those of any nested serializers"""
+        info = model_meta.get_field_info(self.Meta.model)
+        select_related = []
+        prefetch_related = []
+
+        for field in self.fields.values():
+            if field.write_only or field.source == "*" or "." in field.source:
+                continue
+
+            relation_info = info.relations.get(field.source)
+            if relation_info is None:
+                continue
+
+            if relation_info.to_many:
+                # m2m or a reverse FK, so this is a prefetch (unless it's loaded with values_list)
+                child = getattr(field, "child", None)
+                if isinstance(child, NestedModelSerializer) and \
+                        (child.uses_representation_cache() or child.get_compiled_columns() is not None):
+                    continue
+                subplan = child.build_query_plan() if isinstance(child, NestedModelSerializer) else None
+                prefetch_related.append((field.source, relation_info.related_model, subplan))
+
+            elif isinstance(field, NestedModelSerializer):
+                if field.uses_representation_cache():
+                    # its representation comes out of the cache, with nothing but the FK's value needed to find it
+                    continue
+
+                # a nested FK can be joined, along with anything it needs itself
+                subplan = field.build_query_plan()
+                select_related.append(field.source)
+                select_related.extend("{}__{}".format(field.source, lookup) for lookup in subplan["select_related"])
+                prefetch_related.extend(
+                    ("{}__{}".format(field.source, lookup), related_model, nested_subplan)
+                    for lookup, related_model, nested_subplan in subplan["prefetch_related"]
+                )
+
+        return {"select_related": select_related, "prefetch_related": prefetch_related}
 
     def build_nested_field(self, field_name, relation_info, nested_depth):
         """
         Create nested fields for forward and reverse relationships.
         """
+        key = (self.__class__, relation_info.related_model, nested_depth)
+        field_class = _nested_serializer_classes.get(key)
+        if field_class is None:
+            class NestedSerializer(NestedModelSerializer):
+                class Meta:
+                    model = relation_info.related_model
+                    depth = nested_depth - 1
 
-        class NestedSerializer(NestedModelSerializer):
-            class Meta:
-                model = relation_info.related_model
-                depth = nested_depth - 1
+            field_class = _nested_serializer_classes[key] = NestedSerializer
 
-        field_class = NestedSerializer
         field_kwargs = get_nested_relation_kwargs(relation_info)
         field_kwargs["read_only"] = False
 
@@ -79,134 +1280,411 @@ class NestedModelSerializer(serializers.ModelSerializer):
 
         return field_class, field_kwargs
 
+    @classmethod
+    def get_write_plan(cls):
+        """Returns how each field of this serializer gets written. It's worked out once per class, so
+        create/update don't have to introspect the fields and the model on every save.
+        """
+        if "_write_plan" not in cls.__dict__:
+            cls._write_plan = cls().build_write_plan()
+        return cls._write_plan
+
+    def build_write_plan(self):
+        ModelClass = self.Meta.model
+        opts = ModelClass._meta
+        info = model_meta.get_field_info(ModelClass)
+        write_fields = []
+
+        for field_name, field in self.fields.items():
+            source = field.source
+            relation_info = info.relations.get(source)
+            kind, null, related_attname = SCALAR, False, None
+            model_field, reverse = None, False
+            if relation_info is not None:
+                model_field, reverse = get_relation_field(ModelClass, source)
+
+            if isinstance(field, serializers.BaseSerializer) and relation_info is not None:
+                if relation_info.to_many:
+                    if reverse and not model_field.many_to_many:
+                        kind, related_attname = REVERSE_FK, model_field.attname
+                    else:
+                        kind = M2M
+                else:
+                    kind = FK
+                    null = getattr(relation_info.model_field, "null", False)
+
+            elif source in info.fields_and_pk:
+                null = info.fields_and_pk[source].null
+
+            write_fields.append(WriteField(field_name, source, kind, null, related_attname, model_field, reverse))
+
+        # the model fields that update() can dirty check, and the ones that have to be saved along with any change
+        columns = dict((model_field.name, model_field) for model_field in opts.concrete_fields if not model_field.primary_key)
+        auto_now_fields = tuple(name for name, model_field in columns.items() if getattr(model_field, "auto_now", False))
+
+        return WritePlan(opts.pk.name, tuple(write_fields), columns, auto_now_fields)
+
+    @instrumented("to_internal_value")
     def to_internal_value(self, data):
+        if self.parent is None and isinstance(data, dict):
+            # look up everything the payload refers to, at every level, before validating any of it
+            self.resolve_references([data])
+
+        reference_errors = self.get_reference_errors(data)
         try:
             ret = super(NestedModelSerializer, self).to_internal_value(data)
         except AssertionError:
             raise ValidationError({self.__class__.__name__: "Cannot descend and create nested objects."})
+        except ValidationError as exc:
+            # so that every missing reference is reported at once
+            if reference_errors and isinstance(exc.detail, dict):
+                exc.detail.update(reference_errors)
+            raise
+
+        errors = dict(reference_errors, **self.get_null_errors(ret))
+        if errors:
+            raise ValidationError(errors)
 
         # So, in the case that this object is nested, we really really need the id.
         if getattr(self, 'parent', None):
-            child_model = self.Meta.model
-            pk_field_name = child_model._meta.pk.name
-
-            pk_field = self.fields[pk_field_name]
+            pk_field = self.fields[self.get_write_plan().pk_name]
 
             primitive_value = pk_field.get_value(data)
             set_value(ret, pk_field.source_attrs, primitive_value)
 
-            errors = OrderedDict()
-
         return ret
 
+    def get_null_errors(self, validated_data):
+        """A nested FK field can let a null through (with `allow_null=True`, or a payload without an id), which is
+        only fine if the model's FK is nullable
+        """
+        return dict(
+            (write_field.name, ["This field may not be null."]) for write_field in self.get_write_plan().fields
+            if write_field.kind == FK and not write_field.null and
+            write_field.source in validated_data and validated_data[write_field.source] is None
+        )
+
+    def get_reference_errors(self, data):
+        """A nested payload's id has to be something that exists, which `resolve_references` has already looked up
+        (along with everything else). Top-level batches check their ids against the batch instead, and FKs pointing
+        where they already do are fine.
+        """
+        parent = self.parent
+        if parent is None or (isinstance(parent, serializers.ListSerializer) and parent.parent is None):
+            return {}
+
+        pk_name = self.get_write_plan().pk_name
+        value = self.fields[pk_name].get_value(data) if isinstance(data, dict) else empty
+        if value in (empty, None):
+            return {}
+
+        pk = self.to_pk(value)
+        if pk is not None and (pk == self.get_current_pk() or pk in self.get_existing_pks([pk])):
+            return {}
+        return {pk_name: ["{} matching query does not exist.".format(self.Meta.model._meta.object_name)]}
+
+    @instrumented("update")
+    @deferred_writes
     def update(self, instance, validated_data):
-        """This methods acts just like it's parent, except that it creates and updates nested object"""
+        """This methods acts just like it's parent, except that it creates and updates nested object. Only the
+        branches in validated_data are touched, so a partial update leaves everything else (and whatever has been
+        loaded for it) alone.
+        """
         m2m_fields = {}
+        written = [write_field for write_field in self.get_write_plan().fields if write_field.source in validated_data]
+
+        for write_field in self.get_write_plan().fields:
+            if write_field.kind == SCALAR or write_field.source not in validated_data:
+                continue
 
-        for key, field in self.fields.items():
-            if isinstance(field, serializers.BaseSerializer):
-                child_instances = getattr(instance, key)
+            key = write_field.source
+            field = self.fields[write_field.name]
+            value = validated_data[key]
 
-                # If this field is a serializer, we probably are dealing with a nested object
-                if isinstance(validated_data.get(key), list):
+            if write_field.kind in (REVERSE_FK, M2M):
+                if isinstance(value, list):
                     # This will get handled in NestedListSerializer...
                     nested_data = validated_data.pop(key)
-                    updated_data = field.update(child_instances.all(), nested_data)
-                    m2m_fields[key] = updated_data
+                    current_instances = getattr(instance, key).all()
+                    prefetch_cache_name = get_prefetch_cache_name(write_field.model_field, write_field.reverse)
+                    if isinstance(field, NestedListSerializer) and \
+                            prefetch_cache_name not in getattr(instance, "_prefetched_objects_cache", {}):
+                        if field.child.links_by_pk():
+                            # all we need to know is what's linked already
+                            current_instances = current_instances.only(field.child.get_write_plan().pk_name)
+                        elif field.child.get_lookup_columns():
+                            current_instances = current_instances.only(*field.child.get_lookup_columns())
+                    updated_data = field.update(current_instances, nested_data)
+                    # the queryset has been evaluated by now, so hang on to it for the diff below
+                    m2m_fields[write_field] = (current_instances, updated_data)
 
-                elif isinstance(validated_data.get(key), (dict, OrderedDict)):
-                    # Looks like we're dealing with some kind of ForeignKey
-                    nested_data = validated_data.pop(key)
-                    if nested_data.get("id", empty) is empty:
-                        # No id, so it looks like we've got a create...
-                        try:
-                            del nested_data["id"]
-                        except KeyError:
-                            pass
-                        child_instance = field.create(nested_data)
+            elif isinstance(value, dict):
+                # Looks like we're dealing with some kind of ForeignKey
+                nested_data = validated_data.pop(key)
+                if nested_data.get("id", empty) is empty:
+                    # No id, so it looks like we've got a create...
+                    try:
+                        del nested_data["id"]
+                    except KeyError:
+                        pass
+                    child_instance = field.create(nested_data)
+
+                else:
+                    # Update (validation has made sure the id exists)
+                    model_field = self.get_write_plan().columns[key]
+                    current = field.to_pk(nested_data["id"]) == getattr(instance, model_field.attname)
+                    if current and len(nested_data) == 1:
+                        # the same instance, with nothing to change
+                        del validated_data[key]
+                        continue
 
+                    if current and model_field.get_cache_name() in instance.__dict__:
+                        # it's been loaded with us already
+                        child_instance = getattr(instance, key)
                     else:
-                        # Update
-                        ChildClass = field.Meta.model
-                        try:
-                            child_instance = ChildClass.objects.get(pk=nested_data["id"])
-                        except ChildClass.DoesNotExist:
-                            child_instance = field.create(nested_data)
-                        else:
-                            del nested_data["id"]
-                            child_instance = field.update(child_instance, nested_data)
-
-                    validated_data[key] = child_instance
-
-                elif validated_data.get(key, True) is None:
-                    # null value passed - check if null allowed for field
-                    ModelClass = self.Meta.model
-                    model_field = ModelClass._meta.get_field(key)
-                    if model_field.null:
-                        validated_data[key] = None
-
-        # get the instance from super
-        instance = super(NestedModelSerializer, self).update(instance, validated_data)
+                        child_instance = field.get_instance(nested_data["id"])
+                    del nested_data["id"]
+                    child_instance = field.update(child_instance, nested_data)
+
+                validated_data[key] = child_instance
+
+        instance = self.save_changes(instance, validated_data)
 
         # updated m2m fields
-        for field_name, related_instances in m2m_fields.items():
-            with transaction.atomic():
-                try:
-                    field = getattr(instance, field_name)
-                    field.clear()
-                    field.add(*related_instances)
-                except Exception as exc:
-                    pass
+        for write_field, (current_instances, related_instances) in m2m_fields.items():
+            self.update_m2m(instance, write_field, current_instances, related_instances)
+
+        # anything loaded for the relationships we've written is stale now
+        for attr in (COMPILED_VALUES_ATTR, CACHED_REPRESENTATIONS_ATTR):
+            loaded = instance.__dict__.get(attr)
+            for write_field in written:
+                if loaded:
+                    loaded.pop(write_field.source, None)
+        prefetched = instance.__dict__.get("_prefetched_objects_cache")
+        for write_field in written:
+            if prefetched and write_field.model_field is not None:
+                prefetched.pop(get_prefetch_cache_name(write_field.model_field, write_field.reverse), None)
 
         # dump the instance
         return instance
 
-    def create(self, validated_data):
+    def save_changes(self, instance, validated_data):
+        """Does what ModelSerializer.update does, except that only the columns that actually changed get saved,
+        and nothing gets saved at all if none of them did.
+        """
+        raise_errors_on_nested_writes("update", self, validated_data)
+        columns = self.get_write_plan().columns
+        update_fields = []
 
-        ModelClass = self.Meta.model
+        for attr, value in validated_data.items():
+            model_field = columns.get(attr)
+            if model_field is None:
+                # not a column (m2m and the like), so there's nothing to compare
+                setattr(instance, attr, value)
+                continue
 
-        # Remove many-to-many relationships from validated_data.
-        # They are not valid arguments to the default `.create()` method,
-        # as they require that the instance has already been saved.
-        info = model_meta.get_field_info(ModelClass)
+            if model_field.is_relation:
+                # compare the raw column, so we don't go fetching the related object, but always set the new
+                # one since it might have been updated itself
+                changed = getattr(instance, model_field.attname) != getattr(value, "pk", value)
+                setattr(instance, attr, value)
+            else:
+                changed = getattr(instance, model_field.attname) != value
+                if changed:
+                    setattr(instance, attr, value)
+
+            if changed:
+                update_fields.append(model_field.name)
+
+        if update_fields:
+            update_fields.extend(name for name in self.get_write_plan().auto_now_fields if name not in update_fields)
+            instance.save(update_fields=update_fields)
+
+        return instance
+
+    def update_m2m(self, instance, write_field, current_instances, related_instances):
+        """Only removes and adds the related instances that actually changed, leaving the rest of the
+        through rows (and the m2m_changed signals) alone. The changes are queued on the unit of work, to be
+        written along with everybody else's once the whole tree has been saved.
+        """
+        current_pks = set(obj.pk for obj in current_instances)
+        related_pks = set(obj.pk for obj in related_instances)
+
+        removed = [obj for obj in current_instances if obj.pk not in related_pks]
+        added = []
+        for obj in related_instances:
+            if obj.pk not in current_pks:
+                added.append(obj)
+                current_pks.add(obj.pk)
+
+        unit_of_work = self.context[UNIT_OF_WORK_CONTEXT_KEY]
+        if write_field.kind == REVERSE_FK:
+            # reverse FKs that already point at us have been saved with it, no need to save them again
+            added = [obj for obj in added if getattr(obj, write_field.related_attname) != instance.pk]
+            fk = write_field.model_field
+            for obj in added:
+                setattr(obj, fk.name, instance)
+
+            orphans = getattr(self.fields[write_field.name], "orphans", None)
+            if orphans is None:
+                # like the related manager, only a nullable FK can be removed (NestedListSerializer.bind makes sure
+                # nobody asks for anything else)
+                orphans = ORPHANS_NULL if fk.null else ORPHANS_KEEP
+
+            removed = [obj.pk for obj in removed]
+            unit_of_work.assign(
+                instance, fk, [obj.pk for obj in added],
+                removed=removed if orphans == ORPHANS_NULL else (),
+                deleted=removed if orphans == ORPHANS_DELETE else ()
+            )
+            return
+
+        field = getattr(instance, write_field.source)
+        if not field.through._meta.auto_created:
+            raise ValidationError({write_field.name: "Cannot write to a many-to-many with a custom through model."})
+        unit_of_work.link(field, [obj.pk for obj in added], [obj.pk for obj in removed])
+
+    def resolve_references(self, items):
+        """Loads everything a batch of payloads refers to, at every level, with one query per model rather than one
+        per reference. The instances end up in the identity map, and the ids that don't exist in `missing_pks`, where
+        validation finds them.
+        """
+        references = References()
+        self.collect_references(items, references)
+        for ModelClass in references.models():
+            self.load_references(ModelClass, references)
+
+    def collect_references(self, items, references):
+        """Adds the ids the (dict) payloads refer to, and those their nested payloads refer to, to `references`"""
+        items = [item for item in items if isinstance(item, dict)]
+        for field in self._writable_fields:
+            values = [item[field.field_name] for item in items if item.get(field.field_name) is not None]
+            if not values:
+                continue
+
+            if isinstance(field, serializers.ListSerializer) and isinstance(field.child, NestedModelSerializer):
+                child = field.child
+                nested = [child_data for value in values if isinstance(value, list) for child_data in value]
+                pks = [
+                    pk for pk in (
+                        child.to_pk(child_data.get("id")) for child_data in nested if isinstance(child_data, dict)
+                    ) if pk is not None
+                ]
+                if child.links_by_pk():
+                    # these only need to exist, and anything but their id is ignored
+                    references.add_existence(child.Meta.model, pks)
+                else:
+                    references.add(child.Meta.model, pks, child.get_lookup_columns())
+                    child.collect_references(nested, references)
+
+            elif isinstance(field, NestedModelSerializer):
+                current = field.get_current_pk()
+                pks = [
+                    pk for pk in (field.to_pk(value.get("id")) for value in values if isinstance(value, dict))
+                    if pk is not None and pk != current
+                ]
+                references.add(field.Meta.model, pks, field.get_lookup_columns())
+                field.collect_references(values, references)
+
+            elif isinstance(field, NestedPrimaryKeyRelatedField) and is_unrestricted(field.get_queryset()):
+                # (a restricted queryset gets its pks looked up with it, so there's no point in loading them here)
+                ModelClass = field.get_queryset().model
+                pks = [self.to_pk(value, ModelClass) for value in values]
+                references.add(ModelClass, [pk for pk in pks if pk is not None])
+
+            elif isinstance(field, serializers.ManyRelatedField) and \
+                    isinstance(field.child_relation, NestedPrimaryKeyRelatedField) and \
+                    is_unrestricted(field.child_relation.get_queryset()):
+                ModelClass = field.child_relation.get_queryset().model
+                pks = [self.to_pk(pk, ModelClass) for value in values if isinstance(value, list) for pk in value]
+                references.add(ModelClass, [pk for pk in pks if pk is not None])
+
+    def load_references(self, ModelClass, references):
+        """Loads the referenced instances of one model (or, if all they need to do is exist, their pks) with a single
+        query. Models don't depend on each other, so they can be loaded in any order, or all at once.
+        """
+        identity_map = self.identity_map
+        missing_pks = self.missing_pks
+        known = self.context.setdefault(EXISTING_PKS_CONTEXT_KEY, set())
+
+        def unknown(pks):
+            return [pk for pk in pks if (ModelClass, pk) not in identity_map and (ModelClass, pk) not in missing_pks]
+
+        instances = unknown(references.instances.get(ModelClass, ()))
+        existence = [pk for pk in unknown(references.existence.get(ModelClass, ())) if (ModelClass, pk) not in known]
+        if instances:
+            # anything that only has to exist comes along for the ride
+            queryset = ModelClass.objects.all()
+            if references.columns.get(ModelClass):
+                queryset = queryset.only(*references.columns[ModelClass])
+            for pk, obj in queryset.in_bulk(set(instances) | set(existence)).items():
+                identity_map[(ModelClass, pk)] = obj
+        elif existence:
+            for pk in ModelClass.objects.filter(pk__in=existence).values_list("pk", flat=True):
+                known.add((ModelClass, pk))
+
+        missing_pks.update(
+            (ModelClass, pk) for pk in set(instances) | set(existence)
+            if (ModelClass, pk) not in identity_map and (ModelClass, pk) not in known
+        )
+
+    def pop_nested_writes(self, validated_data):
+        """Swaps the nested FKs in validated_data for their instances, and pops off the to-many relationships,
+        which can't be set until the instance has been saved. Returns {field source: related instances}.
+        """
         many_to_many = {}
 
         # Save off the data
-        for key, field in self.fields.items():
-            if isinstance(field, serializers.BaseSerializer):
-                if isinstance(validated_data.get(key), list):
+        for write_field in self.get_write_plan().fields:
+            if write_field.kind == SCALAR or write_field.source not in validated_data:
+                continue
+
+            key = write_field.source
+            field = self.fields[write_field.name]
+            value = validated_data[key]
+
+            if write_field.kind in (REVERSE_FK, M2M):
+                if isinstance(value, list):
                     # One-to-many...
                     nested_data = validated_data.pop(key)
                     many_to_many[key] = field.create(nested_data)
 
-                elif isinstance(validated_data.get(key), dict):
-                    # ForeignKey
-                    nested_data = validated_data.pop(key)
-                    if nested_data.get("id", empty) is empty:
-                        # we don't want to descend into creating objects, so throw a validation error
-                        # here and inform the user to create the related object before saving the
-                        # instance in operation
-                        raise ValidationError("Nested objects must exist prior to creating this parent instance.")
+            elif isinstance(value, dict):
+                # ForeignKey
+                nested_data = validated_data.pop(key)
+                if nested_data.get("id", empty) is empty:
+                    # we don't want to descend into creating objects, so throw a validation error
+                    # here and inform the user to create the related object before saving the
+                    # instance in operation
+                    raise ValidationError("Nested objects must exist prior to creating this parent instance.")
 
-                    else:
-                        # Update
-                        ChildClass = field.Meta.model
-                        try:
-                            child_instance = ChildClass.objects.get(pk=nested_data["id"])
-                        except ChildClass.DoesNotExist:
-                            child_instance = field.create(nested_data)
-                        else:
-                            del nested_data["id"]
-                            child_instance = field.update(child_instance, nested_data)
-
-                    validated_data[key] = child_instance
+                else:
+                    # Update (validation has made sure the id exists)
+                    child_instance = field.get_instance(nested_data["id"])
+                    del nested_data["id"]
+                    child_instance = field.update(child_instance, nested_data)
+
+                validated_data[key] = child_instance
+
+        return many_to_many
+
+    @instrumented("create")
+    @deferred_writes
+    def create(self, validated_data):
+
+        ModelClass = self.Meta.model
+
+        # Remove many-to-many relationships from validated_data.
+        # They are not valid arguments to the default `.create()` method,
+        # as they require that the instance has already been saved.
+        many_to_many = self.pop_nested_writes(validated_data)
 
         # Create the base instance
         instance = ModelClass.objects.create(**validated_data)
 
         # Save many-to-many relationships after the instance is created.
-        if many_to_many:
-            for field_name, value in many_to_many.items():
-                setattr(instance, field_name, value)
+        for write_field in self.get_write_plan().fields:
+            if write_field.source in many_to_many:
+                self.update_m2m(instance, write_field, (), many_to_many[write_field.source])
 
         return instance
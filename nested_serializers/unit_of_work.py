@@ -0,0 +1,143 @@
+"""Deferred relationship writes for nested saves.
+
+Rather than every nested list linking (and unlinking) its rows as it goes, the links get queued on a `UnitOfWork` in
+the root serializer's context, which is flushed once the whole tree has been saved: one DELETE and one bulk INSERT
+per m2m through table, and one UPDATE per reverse FK, all inside the root's transaction.
+"""
+import functools
+from collections import OrderedDict
+
+from django.db import router, transaction
+from django.db.models import Case, Q, Value, When
+from django.db.models.signals import m2m_changed
+
+from .cache import invalidate
+
+UNIT_OF_WORK_CONTEXT_KEY = "nested_unit_of_work"
+
+
+class UnitOfWork(object):
+    """Collects the relationship writes of a nested save, so they can be flushed grouped by model and operation"""
+
+    def __init__(self):
+        # through model -> [(m2m manager, added pks, removed pks)]
+        self.through_rows = OrderedDict()
+        # reverse FK -> [(instance, added pks, removed pks, deleted pks)]
+        self.assignments = OrderedDict()
+
+    def link(self, manager, added=(), removed=()):
+        """Queues adding and removing the through rows between manager's instance and the given pks"""
+        self.through_rows.setdefault(manager.through, []).append((manager, list(added), list(removed)))
+
+    def assign(self, instance, fk, added=(), removed=(), deleted=()):
+        """Queues pointing the reverse FK of the added pks at instance, nulling it out for the removed ones and
+        deleting the deleted ones
+        """
+        self.assignments.setdefault(fk, []).append((instance, list(added), list(removed), list(deleted)))
+
+    def flush(self):
+        for through, entries in self.through_rows.items():
+            self.flush_through_rows(through, entries)
+
+        for fk, entries in self.assignments.items():
+            self.flush_assignments(fk, entries)
+
+        self.through_rows.clear()
+        self.assignments.clear()
+
+    def flush_through_rows(self, through, entries):
+        db = router.db_for_write(through, instance=entries[0][0].instance)
+        manager = through._default_manager.using(db)
+
+        removals = [(m2m, set(removed)) for m2m, _, removed in entries if removed]
+        if removals:
+            self.send_m2m_changed("pre_remove", through, removals, db)
+            condition = Q()
+            for m2m, pks in removals:
+                source_attname, target_attname = m2m.source_field.attname, m2m.target_field.attname
+                condition |= Q(**{source_attname: m2m.related_val[0], target_attname + "__in": pks})
+                if m2m.symmetrical:
+                    condition |= Q(**{target_attname: m2m.related_val[0], source_attname + "__in": pks})
+            manager.filter(condition).delete()
+            self.send_m2m_changed("post_remove", through, removals, db)
+
+        additions = [(m2m, set(added)) for m2m, added, _ in entries if added]
+        if additions:
+            self.send_m2m_changed("pre_add", through, additions, db)
+            rows = []
+            for m2m, pks in additions:
+                source_attname, target_attname = m2m.source_field.attname, m2m.target_field.attname
+                for pk in pks:
+                    rows.append(through(**{source_attname: m2m.related_val[0], target_attname: pk}))
+                    if m2m.symmetrical and pk != m2m.related_val[0]:
+                        rows.append(through(**{source_attname: pk, target_attname: m2m.related_val[0]}))
+            manager.bulk_create(rows)
+            self.send_m2m_changed("post_add", through, additions, db)
+
+    def send_m2m_changed(self, action, through, changes, db):
+        for m2m, pks in changes:
+            m2m_changed.send(
+                sender=through, action=action, instance=m2m.instance, reverse=m2m.reverse, model=m2m.model,
+                pk_set=pks, using=db
+            )
+
+    def flush_assignments(self, fk, entries):
+        db = router.db_for_write(fk.model, instance=entries[0][0])
+        manager = fk.model._default_manager.using(db)
+
+        removed = [pk for _, _, pks, _ in entries for pk in pks]
+        if removed:
+            manager.filter(self.still_assigned(fk, [(instance, pks) for instance, _, pks, _ in entries])).update(
+                **{fk.attname: None}
+            )
+
+        # updates don't send post_save, so anything caching these rows needs telling
+        added = [pk for _, pks, _, _ in entries for pk in pks]
+        invalidate(fk.model, removed + added)
+
+        # before the additions, so the replacements of deleted rows don't clash with them on unique constraints, but
+        # leaving out whatever is moving to another instance
+        if any(deleted for _, _, _, deleted in entries):
+            manager.filter(self.still_assigned(fk, [(instance, pks) for instance, _, _, pks in entries])).exclude(
+                pk__in=added
+            ).delete()
+
+        additions = [(fk.get_foreign_related_value(instance)[0], pks) for instance, pks, _, _ in entries if pks]
+        if len(additions) == 1:
+            value, pks = additions[0]
+            manager.filter(pk__in=pks).update(**{fk.attname: value})
+        elif additions:
+            whens = [When(pk__in=pks, then=Value(value)) for value, pks in additions]
+            manager.filter(pk__in=[pk for _, pks in additions for pk in pks]).update(
+                **{fk.attname: Case(*whens, output_field=fk.related_field)}
+            )
+
+    def still_assigned(self, fk, entries):
+        """A filter for the given (instance, pks) rows that still point at the instance they're being taken from"""
+        condition = Q()
+        for instance, pks in entries:
+            if pks:
+                condition |= Q(**{"pk__in": pks, fk.attname: fk.get_foreign_related_value(instance)[0]})
+        return condition
+
+
+def deferred_writes(method):
+    """Runs the decorated save in a transaction, with a `UnitOfWork` in the context for the nested saves under it to
+    queue their relationship writes on. Whoever opens the unit of work flushes it, so nested saves only queue.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.context.get(UNIT_OF_WORK_CONTEXT_KEY) is not None:
+            return method(self, *args, **kwargs)
+
+        # list serializers save their child's model
+        ModelClass = getattr(self, "child", self).Meta.model
+        unit_of_work = self.context[UNIT_OF_WORK_CONTEXT_KEY] = UnitOfWork()
+        try:
+            with transaction.atomic(using=router.db_for_write(ModelClass)):
+                result = method(self, *args, **kwargs)
+                unit_of_work.flush()
+            return result
+        finally:
+            del self.context[UNIT_OF_WORK_CONTEXT_KEY]
+    return wrapper